@@ -201,7 +201,7 @@ void setupBLE() {
     BLEService *pService = pServer->createService(BLE_SERVICE_UUID);
     BLECharacteristic *pCharacteristic = pService->createCharacteristic(
         BLE_CHARACTERISTIC_UUID,
-        BLECharacteristic::PROPERTY_READ | BLECharacteristic::PROPERTY_WRITE
+        BLECharacteristic::PROPERTY_READ | BLECharacteristic::PROPERTY_WRITE | BLECharacteristic::PROPERTY_WRITE_NR
     );
     pCharacteristic->setCallbacks(new MyBLECharacteristicCallbacks());
     pService->start();
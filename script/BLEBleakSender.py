@@ -1,5 +1,9 @@
+import argparse
 import asyncio
-from bleak import BleakClient, discover
+import random
+import struct
+import time
+import zlib
 
 DEVICE_ADDRESS = "3c:84:27:cc:18:85"
 
@@ -7,29 +11,435 @@ BLE_SERVICE_UUID = "4fafc201-1fb5-459e-8fcc-c5c9c331914b"
 BLE_CHARACTERISTIC_UUID = "beb5483e-36e1-4688-b7f5-ea07361b26a8"
 FILE_PATH = "Preprocessing/binary.txt"
 
+# ATT header of a write: opcode + attribute handle.
+ATT_HEADER = 3
+
+# Resumable transfer. The client writes START (size and CRC32 of the whole
+# file) and reads the characteristic back: the device answers with STATUS,
+# the offset up to which it already stored this same file (0 for a new one)
+# and the sequence number it expects next.
+# DATA chunks carry a sequence number (chunks stored so far, modulo 2**16),
+# their offset and the CRC32 of their bytes; a chunk whose CRC32 does not
+# match is dropped. The one expected next is appended to the file; one up to
+# HOLD_WINDOW sequence numbers ahead is held in RAM until the gap before it
+# is filled. STATUS also carries a bitmap of the held chunks (bit i for the
+# sequence number i + 1 past the expected one), so after a lost chunk only
+# that chunk is sent again, and after a dropped connection (held chunks are
+# discarded then) only the part past the stored offset. END asks the device
+# to check the whole file.
+TRANSFER_START = 0x01
+TRANSFER_DATA = 0x02
+TRANSFER_END = 0x03
+START = struct.Struct("<BII")       # opcode, file size, CRC32 of the file
+DATA_HEADER = struct.Struct("<BHII")  # opcode, sequence, offset, CRC32 of the chunk
+STATUS = struct.Struct("<BIHI")     # state, stored offset, next sequence, held chunks
+HOLD_WINDOW = 32
+STATE_IDLE, STATE_RECEIVING, STATE_COMPLETE, STATE_CORRUPT = range(4)
+
 def get_data_from_file(file_path):
     with open(file_path, 'r') as file:
         for line in file:
             yield line.strip().encode('utf-8')
 
-async def send_data():
-    async with BleakClient(DEVICE_ADDRESS) as client:
+def get_payload(file_path):
+    # The file exactly as stored, in one buffer; testAudioSender.ino writes
+    # what it receives to /binary.txt unchanged.
+    with open(file_path, 'rb') as file:
+        return file.read()
+
+class MockTransferDevice:
+    # The device side of the resumable transfer, as the firmware has to
+    # implement it; `stored` plays the SD card file and survives reconnects.
+    def __init__(self):
+        self.stored = bytearray()
+        self.size = self.crc = None
+        self.sequence = 0
+        # Chunks past a gap, by sequence number: (offset, bytes).
+        self.held = {}
+        self.state = STATE_IDLE
+
+    def write(self, data):
+        opcode = data[0]
+        if opcode == TRANSFER_START:
+            _, size, crc = START.unpack(data)
+            if (size, crc) != (self.size, self.crc):
+                self.stored = bytearray()
+                self.size, self.crc, self.sequence = size, crc, 0
+            self.held = {}
+            self.state = STATE_RECEIVING
+            self._check()
+        elif opcode == TRANSFER_DATA and self.state == STATE_RECEIVING:
+            _, sequence, offset, crc = DATA_HEADER.unpack_from(data)
+            chunk = bytes(data[DATA_HEADER.size:])
+            ahead = (sequence - self.sequence) & 0xFFFF
+            if zlib.crc32(chunk) != crc or offset + len(chunk) > self.size or ahead > HOLD_WINDOW:
+                return
+            self.held[sequence] = (offset, chunk)
+            # Append whatever is contiguous now; a held chunk at the wrong
+            # offset is dropped and has to come again.
+            while self.sequence in self.held:
+                offset, chunk = self.held.pop(self.sequence)
+                if offset != len(self.stored):
+                    break
+                self.stored += chunk
+                self.sequence = (self.sequence + 1) & 0xFFFF
+        elif opcode == TRANSFER_END and self.state == STATE_RECEIVING:
+            self._check()
+
+    def _check(self):
+        if len(self.stored) == self.size:
+            self.state = STATE_COMPLETE if zlib.crc32(self.stored) == self.crc else STATE_CORRUPT
+
+    def read(self):
+        held = sum(1 << ((sequence - self.sequence - 1) & 0xFFFF) for sequence in self.held)
+        return STATUS.pack(self.state, len(self.stored), self.sequence, held)
+
+class MockBleakClient:
+    # Stand-in for bleak.BleakClient with a simple link model: every call
+    # spends call_latency in the host's Bluetooth stack (concurrent calls
+    # overlap), the link carries packets_per_interval writes per connection
+    # interval, and a write with response waits one more interval for the
+    # confirmation. Everything written ends up in `received`, or goes to
+    # `device` (e.g. a MockTransferDevice), which also answers reads. A
+    # flaky link loses a fraction `loss` of the writes without response and
+    # drops the connection with probability `disconnect_rate` per write.
+    def __init__(self, address=DEVICE_ADDRESS, mtu_size=247, interval=0.0075, packets_per_interval=4,
+                 call_latency=0.002, device=None, loss=0.0, disconnect_rate=0.0, rng=None):
+        self.address = address
+        self.device = device
+        self.loss = loss
+        self.disconnect_rate = disconnect_rate
+        self.rng = rng or random.Random(0)
+        self.mtu_size = mtu_size
+        self.interval = interval
+        self.call_latency = call_latency
+        self.packets_per_interval = packets_per_interval
+        self.received = bytearray()
+        self.writes = 0
+        self._connected = False
+        self._link = None
+
+    @property
+    def is_connected(self):
+        return self._connected
+
+    async def connect(self):
+        self._connected = True
+        self._link = asyncio.Lock()
+        return True
+
+    async def disconnect(self):
+        self._connected = False
+        return True
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.disconnect()
+
+    async def write_gatt_char(self, char_specifier, data, response=None):
+        if not self._connected:
+            raise ConnectionError("not connected")
+        if len(data) > self.mtu_size - ATT_HEADER:
+            raise ValueError(f"{len(data)} bytes do not fit into the MTU of {self.mtu_size}")
+        await asyncio.sleep(self.call_latency)
+        async with self._link:
+            if not self._connected:
+                raise ConnectionError("disconnected")
+            if self.rng.random() < self.disconnect_rate:
+                self._connected = False
+                raise ConnectionError("link lost")
+            await asyncio.sleep(self.interval / self.packets_per_interval)
+            self.writes += 1
+            # bleak writes with response unless told otherwise.
+            confirmed = response is None or response
+            if confirmed or self.rng.random() >= self.loss:
+                if self.device is None:
+                    self.received += data
+                else:
+                    self.device.write(bytes(data))
+        if confirmed:
+            await asyncio.sleep(self.interval)
+
+    async def read_gatt_char(self, char_specifier):
+        if not self._connected:
+            raise ConnectionError("not connected")
+        await asyncio.sleep(self.call_latency + self.interval)
+        return bytearray(self.device.read() if self.device else self.received)
+
+class ChunkedUploader:
+    # Sends a payload in slices of the negotiated MTU minus the ATT header,
+    # as writes without response. Up to `window` writes are in flight at a
+    # time; they are issued in order, so the device stores the slices in
+    # order.
+    def __init__(self, client, characteristic=BLE_CHARACTERISTIC_UUID, window=8, chunk_size=None):
+        self.client = client
+        self.characteristic = characteristic
+        self.window = window
+        self.chunk_size = chunk_size or client.mtu_size - ATT_HEADER
+        self.bytes_sent = 0
+        self.writes = 0
+        self.seconds = 0.0
+
+    @property
+    def throughput(self):
+        return self.bytes_sent / self.seconds if self.seconds else 0.0
+
+    def chunks(self, payload):
+        view = memoryview(payload)
+        return [view[i:i + self.chunk_size] for i in range(0, len(view), self.chunk_size)]
+
+    async def upload(self, payload):
+        return await self.send(self.chunks(payload))
+
+    async def send(self, chunks):
+        # Writes each of `chunks` as it is; returns the bytes sent so far.
+        slots = asyncio.Semaphore(self.window)
+        pending = set()
+        started = time.perf_counter()
+
+        async def write(chunk):
+            try:
+                await self.client.write_gatt_char(self.characteristic, bytes(chunk), response=False)
+                self.bytes_sent += len(chunk)
+                self.writes += 1
+            finally:
+                slots.release()
+
+        try:
+            for chunk in chunks:
+                await slots.acquire()
+                task = asyncio.create_task(write(chunk))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+                # A failed write stops the upload instead of queueing more.
+                for done in [task for task in pending if task.done()]:
+                    done.result()
+            await asyncio.gather(*pending)
+        except BaseException:
+            for task in pending:
+                task.cancel()
+            raise
+        finally:
+            self.seconds += time.perf_counter() - started
+        return self.bytes_sent
+
+def transient_errors():
+    # What a dropped or failed connection raises.
+    errors = (ConnectionError, OSError, asyncio.TimeoutError)
+    try:
+        from bleak.exc import BleakError
+    except ImportError:
+        return errors
+    return errors + (BleakError,)
+
+class ResumableUploader:
+    # Uploads a payload with the resumable transfer described at the top of
+    # this file. `connect` returns a new, not yet connected client each time;
+    # after a dropped connection it is called again after an exponential
+    # backoff (with jitter) and the transfer continues where the device's
+    # STATUS says. STATUS is read back after every batch of chunks; the
+    # chunks it reports neither stored nor held are sent again at the head
+    # of the next batch, so each lost write costs one chunk. New chunks go
+    # at most HOLD_WINDOW sequence numbers past the device's position;
+    # batches halve after a loss and grow back to `confirm_every` chunks
+    # while nothing is lost.
+    def __init__(self, connect, payload, characteristic=BLE_CHARACTERISTIC_UUID, window=8, confirm_every=32,
+                 retries=8, backoff=0.5, max_backoff=30.0):
+        self.connect = connect
+        self.payload = bytes(payload)
+        self.crc = zlib.crc32(self.payload)
+        self.characteristic = characteristic
+        self.window = window
+        self.confirm_every = confirm_every
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.offset = 0
+        # Payload bytes written, including the ones sent again.
+        self.bytes_sent = 0
+        self.reconnects = 0
+
+    async def _status(self, client):
+        # Firmware without the resumable transfer answers with something
+        # else (or nothing); retrying would not help.
+        reply = bytes(await client.read_gatt_char(self.characteristic))
+        if len(reply) != STATUS.size:
+            raise RuntimeError(f"device does not support resumable upload: STATUS reply of {len(reply)} bytes, "
+                               f"expected {STATUS.size}")
+        return STATUS.unpack(reply)
+
+    async def _session(self, client):
+        size = len(self.payload)
+        await client.write_gatt_char(self.characteristic, START.pack(TRANSFER_START, size, self.crc), response=True)
+        state, self.offset, sequence, _ = await self._status(client)
+        print(f"Connected, MTU {client.mtu_size}: device has {self.offset}/{size} bytes")
+
+        chunk_size = client.mtu_size - ATT_HEADER - DATA_HEADER.size
+        uploader = ChunkedUploader(client, self.characteristic, self.window)
+        try:
+            await self._send(client, uploader, state, sequence, chunk_size)
+        finally:
+            self.bytes_sent += uploader.bytes_sent - uploader.writes * DATA_HEADER.size
+
+    async def _send(self, client, uploader, state, sequence, chunk_size):
+        size = len(self.payload)
+        # Chunks written but neither stored nor held yet, by sequence number,
+        # in the order they were sent; `position` and `following` are the
+        # offset and sequence number of the next new chunk.
+        missing = {}
+        position, following = self.offset, sequence
+        stalled = 0
+        batch = self.confirm_every
+        while state == STATE_RECEIVING and self.offset < size:
+            chunks = list(missing.values())[:batch]
+            while len(chunks) < batch and position < size and (following - sequence) & 0xFFFF <= HOLD_WINDOW:
+                chunk = self.payload[position:position + chunk_size]
+                missing[following] = DATA_HEADER.pack(TRANSFER_DATA, following, position, zlib.crc32(chunk)) + chunk
+                chunks.append(missing[following])
+                position += len(chunk)
+                following = (following + 1) & 0xFFFF
+            await uploader.send(chunks)
+            state, offset, sequence, held = await self._status(client)
+
+            written, lost = len(missing), 0
+            for number in list(missing):
+                ahead = (number - sequence) & 0xFFFF
+                if ahead > HOLD_WINDOW or (ahead > 0 and held >> (ahead - 1) & 1):
+                    del missing[number]
+                else:
+                    lost += 1
+            if sequence != following and sequence not in missing:
+                # The device dropped a chunk it had held: go back to its
+                # position.
+                missing.clear()
+                position, following = offset, sequence
+            # A round in which nothing new arrived is a stall; several in a
+            # row mean the link is not really up any more.
+            stalled = stalled + 1 if lost == written else 0
+            if stalled > 3:
+                raise ConnectionError("device accepts no more chunks")
+            self.offset = offset
+            batch = max(1, batch // 2) if lost else min(self.confirm_every, batch * 2)
+
+        if state == STATE_RECEIVING:
+            await client.write_gatt_char(self.characteristic, bytes([TRANSFER_END]), response=True)
+            state, self.offset, _, _ = await self._status(client)
+        if state == STATE_CORRUPT:
+            raise ValueError("the file on the device does not match its CRC32")
+        if state != STATE_COMPLETE:
+            raise ConnectionError(f"transfer ended in state {state}")
+
+    async def run(self):
+        attempt = 0
+        while True:
+            before = self.offset
+            try:
+                async with self.connect() as client:
+                    await self._session(client)
+                return self.bytes_sent
+            except transient_errors() as e:
+                # Progress since the last failure resets the backoff.
+                attempt = 1 if self.offset > before else attempt + 1
+                if attempt > self.retries:
+                    raise
+                delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+                print(f"Connection lost at {self.offset}/{len(self.payload)} bytes ({e}); "
+                      f"reconnecting in {delay:.1f} s")
+                self.reconnects += 1
+                await asyncio.sleep(delay)
+
+def open_client(address, mock=False, **mock_options):
+    if mock:
+        return MockBleakClient(address, **mock_options)
+    from bleak import BleakClient
+
+    return BleakClient(address)
+
+async def send_data(address=DEVICE_ADDRESS, file_path=FILE_PATH, mock=False):
+    async with open_client(address, mock) as client:
         print(f"Connected: {client.is_connected}")
 
-        data_generator = get_data_from_file(FILE_PATH)
+        data_generator = get_data_from_file(file_path)
 
+        started = time.perf_counter()
+        sent = 0
         for data_to_send in data_generator:
             if data_to_send == b'quit':
-                return
+                break
             await client.write_gatt_char(BLE_CHARACTERISTIC_UUID, data_to_send)
+            sent += len(data_to_send)
             print(f"Data sent: {data_to_send}")
+        seconds = time.perf_counter() - started
+        print(f"{sent} bytes in {seconds:.2f} s ({sent / seconds if seconds else 0:.0f} bytes/s)")
+
+async def upload_data(address=DEVICE_ADDRESS, file_path=FILE_PATH, window=8, mock=False):
+    payload = get_payload(file_path)
+    async with open_client(address, mock) as client:
+        print(f"Connected: {client.is_connected}, MTU {client.mtu_size}")
+        uploader = ChunkedUploader(client, window=window)
+        await uploader.upload(payload)
+        print(f"Uploaded {uploader.bytes_sent} bytes in {len(uploader.chunks(payload))} writes of up to "
+              f"{uploader.chunk_size} bytes: {uploader.seconds:.2f} s ({uploader.throughput:.0f} bytes/s)")
+        if mock:
+            assert client.received == payload
+
+async def resume_upload(address=DEVICE_ADDRESS, file_path=FILE_PATH, window=8, mock=False, loss=0.0,
+                        disconnect_rate=0.0):
+    payload = get_payload(file_path)
+    # The simulated device keeps its storage across reconnects.
+    device = MockTransferDevice() if mock else None
+    rng = random.Random(0)
+
+    def connect():
+        return open_client(address, mock, device=device, loss=loss, disconnect_rate=disconnect_rate, rng=rng)
+
+    uploader = ResumableUploader(connect, payload, window=window)
+    started = time.perf_counter()
+    await uploader.run()
+    seconds = time.perf_counter() - started
+    print(f"Transferred {len(payload)} bytes in {seconds:.2f} s ({len(payload) / seconds:.0f} bytes/s): "
+          f"{uploader.bytes_sent - len(payload)} bytes sent again, {uploader.reconnects} reconnects")
+    if mock:
+        assert device.stored == payload
 
 async def discover_devices():
-    devices = await discover()
+    from bleak import BleakScanner
+
+    devices = await BleakScanner.discover()
     for device in devices:
         print(device)
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Send the bit file to the T-TWR over BLE.")
+    parser.add_argument("--address", default=DEVICE_ADDRESS)
+    parser.add_argument("--file", default=FILE_PATH)
+    parser.add_argument("--upload", action="store_true",
+                        help="send the file in MTU-sized writes without response instead of line by line")
+    parser.add_argument("--resume", action="store_true",
+                        help="like --upload, with sequence numbers, CRC32 per chunk, resume and reconnect")
+    parser.add_argument("--window", type=int, default=8, help="writes in flight at a time with --upload/--resume")
+    parser.add_argument("--mock", action="store_true", help="talk to a simulated device instead of the T-TWR")
+    parser.add_argument("--mock-loss", type=float, default=0.0,
+                        help="fraction of writes the simulated link loses")
+    parser.add_argument("--mock-disconnect-rate", type=float, default=0.0,
+                        help="probability per write that the simulated link drops the connection")
+    parser.add_argument("--discover", action="store_true", help="list nearby BLE devices and exit")
+    return parser.parse_args()
+
 async def run():
-    await send_data()
+    args = parse_args()
+    if args.discover:
+        await discover_devices()
+    elif args.resume:
+        await resume_upload(args.address, args.file, args.window, args.mock, args.mock_loss,
+                            args.mock_disconnect_rate)
+    elif args.upload:
+        await upload_data(args.address, args.file, args.window, args.mock)
+    else:
+        await send_data(args.address, args.file, args.mock)
 
-asyncio.run(run())
\ No newline at end of file
+if __name__ == '__main__':
+    asyncio.run(run())
@@ -0,0 +1,13 @@
+from .capturefile import load_capture, load_samples, open_capture
+from .envelope import compute_envelope, compute_smoothed_envelope, extract_bits_from_envelope
+from .fec import fec_decode, fec_encode
+from .filters import StreamingFilter, design_filter, highpass_filter
+from .frames import decode_frame, iter_frames
+from .image import binary_string_to_image, payload_to_image
+from .markers import find_frames, find_markers
+from .mfsk import MFSKModem
+from .payload import decode_payload, encode_image
+from .slicing import bits_to_string, pack_bits, string_to_bits, unpack_bits
+from .tiles import TileReconstructor, encode_tiles
+from .tones import ToneDetector
+from .tracking import AdaptiveThreshold, SymbolTracker, track_symbols
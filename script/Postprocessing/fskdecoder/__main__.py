@@ -0,0 +1,29 @@
+import importlib
+import sys
+
+COMMANDS = {
+    "convert": "capturefile",
+    "markers": "markers",
+    "tones": "tones",
+    "frames": "frames",
+    "stream": "streaming",
+    "batch": "batch",
+    "precision-check": "regression",
+    "modem": "mfsk",
+    "simulate": "simulate",
+    "benchmark": "benchmark",
+    "live": "live",
+    "fec": "fec",
+    "tiles": "tiles",
+}
+
+
+def main(argv):
+    if not argv or argv[0] not in COMMANDS:
+        print(f"Usage: python -m fskdecoder {{{','.join(COMMANDS)}}} ...")
+        return 1
+    module = importlib.import_module(f".{COMMANDS[argv[0]]}", __package__)
+    return module.main(argv[1:])
+
+
+sys.exit(main(sys.argv[1:]))
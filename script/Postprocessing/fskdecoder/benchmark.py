@@ -0,0 +1,174 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from .simulate import ChannelSimulator, random_frames
+from .slicing import count_bit_errors
+
+DECODERS = ("frames", "stream", "tracker", "offline")
+
+# Decoders that hold the whole capture (as float64) in memory are only run up
+# to this size unless --offline-limit says otherwise.
+OFFLINE_LIMIT = 10 ** 7
+
+
+def decode_frames(file_path):
+    from .capturefile import read_capture_chunks
+    from .frames import iter_frames
+    from .slicing import unpack_bits
+
+    return [(frame["start"], unpack_bits(frame["bits"], frame["bit_count"]))
+            for frame in iter_frames(read_capture_chunks(file_path, chunk_size=1 << 16))]
+
+
+def decode_stream(file_path):
+    from .capturefile import read_capture_chunks
+    from .streaming import StreamingDemodulator
+
+    demodulator = StreamingDemodulator()
+    for chunk in read_capture_chunks(file_path, chunk_size=1 << 16):
+        demodulator.process(chunk)
+    demodulator.flush()
+    return [(position, np.array([int(bit)], np.uint8)) for position, _, bit in demodulator.bit_positions]
+
+
+def decode_tracker(file_path):
+    from .capturefile import open_capture
+    from .envelope import compute_envelope
+    from .filters import highpass_filter
+    from .markers import SYMBOL_PERIOD, TONE_DURATION, estimate_sampling_rate, find_frames
+    from .slicing import string_to_bits
+    from .tracking import track_symbols
+
+    capture = open_capture(file_path)
+    signal = np.asarray(capture.samples, dtype=np.float64)
+    filtered = highpass_filter(signal, cutoff=700, fs=capture.sampling_rate)
+    decoded = []
+    for frame in find_frames(signal):
+        rate = estimate_sampling_rate(signal, (frame["marker_start"], frame["start"]))
+        envelope = compute_envelope(filtered[frame["start"]:frame["end"]])
+        tracker = track_symbols(envelope, 0, envelope.size, SYMBOL_PERIOD * rate, int(TONE_DURATION * rate))
+        decoded.append((frame["start"], string_to_bits(tracker.bitstring)))
+    return decoded
+
+
+def decode_offline(file_path):
+    from .capturefile import open_capture
+    from .envelope import compute_smoothed_envelope, extract_bits_from_envelope
+    from .markers import find_frames
+    from .slicing import string_to_bits
+
+    capture = open_capture(file_path)
+    signal = np.asarray(capture.samples, dtype=np.float64)
+    smoothed_envelope = compute_smoothed_envelope(signal, capture.sampling_rate, window_size=300)
+    return [(frame["start"], string_to_bits(extract_bits_from_envelope(
+                smoothed_envelope, frame["start"], frame["end"], min_height=300, peak_distance=600)[0]))
+            for frame in find_frames(signal)]
+
+
+def _peak_memory():
+    # High-water mark of this process in bytes.
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_decoder(name, file_path):
+    # Runs in a fresh worker process, so the memory high-water mark belongs
+    # to this decoder alone. Memory is reported above what the imports
+    # already took.
+    import scipy.fft
+    import scipy.signal  # noqa: F401
+
+    decoder = globals()[f"decode_{name}"]
+    try:
+        baseline = _peak_memory()
+        tracing = False
+    except ImportError:
+        import tracemalloc
+
+        tracemalloc.start()
+        baseline, tracing = 0, True
+
+    started = time.perf_counter()
+    decoded = decoder(file_path)
+    seconds = time.perf_counter() - started
+
+    if tracing:
+        import tracemalloc
+
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    else:
+        peak = _peak_memory() - baseline
+    return decoded, seconds, peak
+
+
+def score(decoded, spans):
+    # Bits each decoder placed inside a transmitted frame are compared with
+    # what was sent; a frame without decoded bits counts as all wrong.
+    positions = np.array([position for position, _ in decoded], dtype=np.int64)
+    order = np.argsort(positions, kind="stable")
+    positions = positions[order]
+    errors = bits = found = 0
+    for first, end, reference in spans:
+        left, right = np.searchsorted(positions, [first, end])
+        received = [decoded[order[i]][1] for i in range(left, right)]
+        received = np.concatenate(received) if received else np.zeros(0, np.uint8)
+        errors += count_bit_errors(received, reference)
+        bits += reference.size
+        found += bool(received.size)
+    return errors, bits, found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m fskdecoder benchmark",
+                                     description="Throughput, memory and bit error rate of the decoders "
+                                                 "on simulated captures.")
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1e4, 1e5, 1e6, 1e7, 1e8],
+                        help="capture sizes in samples")
+    parser.add_argument("--decoders", nargs="+", choices=DECODERS, default=list(DECODERS))
+    parser.add_argument("--offline-limit", type=float, default=OFFLINE_LIMIT)
+    parser.add_argument("--frame-bits", type=int, default=8)
+    parser.add_argument("--idle", type=float, default=0.5, help="silence before every frame [s]")
+    parser.add_argument("--noise", type=float, default=None, help="noise standard deviation [ADC counts]")
+    parser.add_argument("--gain-drift", type=float, default=0.2)
+    parser.add_argument("--drift-period", type=float, default=600.0)
+    parser.add_argument("--jitter", type=float, default=1e-6)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", metavar="DIRECTORY", help="write the simulated captures here and keep them")
+    args = parser.parse_args(argv)
+
+    channel = {"idle": args.idle, "gain_drift": args.gain_drift, "drift_period": args.drift_period,
+               "jitter": args.jitter, "seed": args.seed}
+    if args.noise is not None:
+        channel["noise"] = args.noise
+    frames = random_frames(256, args.frame_bits, args.seed)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        directory = args.keep or scratch
+        os.makedirs(directory, exist_ok=True)
+        print(f"{'decoder':>8} {'samples':>10} {'samples/s':>11} {'peak MiB':>9} {'frames':>9} {'BER':>10}")
+        for size in (int(size) for size in args.sizes):
+            file_path = os.path.join(directory, f"simulated_{size}.twr")
+            simulator = ChannelSimulator(frames, size, **channel)
+            simulator.write(file_path)
+
+            for name in args.decoders:
+                if name in ("tracker", "offline") and size > args.offline_limit:
+                    print(f"{name:>8} {size:>10} {'skipped (whole capture in memory)':>42}")
+                    continue
+                # One process per run: a fresh memory high-water mark each time.
+                with multiprocessing.Pool(1, maxtasksperchild=1) as pool:
+                    decoded, seconds, peak = pool.apply(run_decoder, (name, file_path))
+                errors, bits, found = score(decoded, simulator.spans)
+                ber = f"{errors / bits:.2e}" if bits else "-"
+                print(f"{name:>8} {size:>10} {size / seconds:>11.3g} {peak / 2 ** 20:>9.1f} "
+                      f"{found:>4}/{len(simulator.spans):<4} {ber:>10}")
+    return 0
@@ -0,0 +1,301 @@
+import os
+import struct
+import time
+
+import numpy as np
+
+# Binary capture layout (all little-endian):
+#   header  : magic, version, header size, sample period [s], start time [unix s],
+#             samples per block, total sample count, source port (utf-8, NUL padded)
+#   payload : uint16 samples, written in blocks of `block_samples`
+MAGIC = b'TWRC'
+VERSION = 1
+HEADER_FORMAT = '<4sHHddIQ64s'
+HEADER_SIZE = 128
+SAMPLE_DTYPE = np.dtype('<u2')
+
+DEFAULT_SAMPLE_PERIOD = 277e-6
+DEFAULT_BLOCK_SAMPLES = 4096
+
+
+class Capture:
+    def __init__(self, samples, sample_period, start_time, port):
+        self.samples = samples
+        self.sample_period = sample_period
+        self.start_time = start_time
+        self.port = port
+
+    @property
+    def sampling_rate(self):
+        return 1 / self.sample_period
+
+    def __len__(self):
+        return len(self.samples)
+
+
+class CaptureWriter:
+    def __init__(self, file_path, sample_period=DEFAULT_SAMPLE_PERIOD, port="",
+                 start_time=None, block_samples=DEFAULT_BLOCK_SAMPLES):
+        self.file_path = file_path
+        self.sample_period = sample_period
+        self.port = port
+        self.start_time = time.time() if start_time is None else start_time
+        self.block_samples = block_samples
+        self.sample_count = 0
+
+        self._block = np.empty(block_samples, dtype=SAMPLE_DTYPE)
+        self._fill = 0
+        self._file = open(file_path, 'wb')
+        self._write_header()
+
+    def _write_header(self):
+        header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, HEADER_SIZE, self.sample_period,
+                             self.start_time, self.block_samples, self.sample_count,
+                             self.port.encode('utf-8')[:64])
+        self._file.seek(0)
+        self._file.write(header.ljust(HEADER_SIZE, b'\0'))
+
+    def write(self, samples):
+        samples = np.asarray(samples)
+        if np.any((samples < 0) | (samples > 0xFFFF)):
+            raise ValueError("Samples must fit into uint16")
+        samples = samples.astype(SAMPLE_DTYPE, copy=False)
+
+        offset = 0
+        while offset < samples.size:
+            take = min(self.block_samples - self._fill, samples.size - offset)
+            self._block[self._fill:self._fill + take] = samples[offset:offset + take]
+            self._fill += take
+            offset += take
+            if self._fill == self.block_samples:
+                self._flush_block()
+
+    def _flush_block(self):
+        if self._fill:
+            self._file.write(self._block[:self._fill].tobytes())
+            self.sample_count += self._fill
+            self._fill = 0
+
+    def flush(self):
+        self._flush_block()
+        self._file.flush()
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._flush_block()
+        self._write_header()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def is_binary_capture(file_path):
+    with open(file_path, 'rb') as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def read_header(file_path):
+    with open(file_path, 'rb') as file:
+        raw = file.read(struct.calcsize(HEADER_FORMAT))
+    magic, version, header_size, sample_period, start_time, block_samples, sample_count, port = \
+        struct.unpack(HEADER_FORMAT, raw)
+    if magic != MAGIC:
+        raise ValueError(f"{file_path} is not a binary capture")
+    if version != VERSION:
+        raise ValueError(f"Unsupported capture version {version}")
+    return {
+        "header_size": header_size,
+        "sample_period": sample_period,
+        "start_time": start_time,
+        "block_samples": block_samples,
+        "sample_count": sample_count,
+        "port": port.rstrip(b'\0').decode('utf-8', errors='replace'),
+    }
+
+
+def open_capture(file_path):
+    header = read_header(file_path)
+    with open(file_path, 'rb') as file:
+        file.seek(0, 2)
+        available = (file.tell() - header["header_size"]) // SAMPLE_DTYPE.itemsize
+
+    # A capture that was not closed cleanly still has sample_count == 0 in
+    # its header; everything that reached the disk is usable.
+    count = min(header["sample_count"], available) if header["sample_count"] else available
+    if count:
+        samples = np.memmap(file_path, dtype=SAMPLE_DTYPE, mode='r',
+                            offset=header["header_size"], shape=(count,))
+    else:
+        samples = np.zeros(0, dtype=SAMPLE_DTYPE)
+    return Capture(samples, header["sample_period"], header["start_time"], header["port"])
+
+
+MAX_DIGITS = 5
+
+
+def _parse_lines(raw):
+    # Slow path for captures with damaged lines: every line is read right to
+    # left, one digit position at a time, for all lines at once.
+    ends = np.flatnonzero(raw == ord('\n'))
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    ends = ends - ((ends > starts) & (raw[np.maximum(ends - 1, 0)] == ord('\r')))
+    lengths = ends - starts
+
+    bad = lengths > MAX_DIGITS
+    values = np.zeros(lengths.size, dtype=np.int32)
+    for position in range(MAX_DIGITS):
+        present = position < lengths
+        digit = raw[np.where(present, ends - 1 - position, 0)].astype(np.int32) - ord('0')
+        bad |= present & ((digit < 0) | (digit > 9))
+        values += np.where(present, digit, 0) * 10 ** position
+
+    bad |= values > 0xFFFF
+    keep = ~bad & (lengths > 0)
+    return values[keep].astype(np.uint16), int(np.count_nonzero(bad))
+
+
+def parse_samples(data):
+    # Parses b"123\r\n456\n..." into uint16. Lines holding anything but
+    # digits (scanSerialPort.py decodes with errors='replace', so broken reads
+    # turn into U+FFFD) or a value above 65535 are dropped.
+    # Returns (samples, number of dropped lines).
+    data = bytes(data)
+    raw = np.frombuffer(data, dtype=np.uint8)
+    if raw.size == 0:
+        return np.zeros(0, dtype=np.uint16), 0
+
+    # Every byte that is not a digit must be a line ending.
+    separators = np.count_nonzero((raw - np.uint8(ord('0'))) > 9)
+    if separators != np.count_nonzero(raw == ord('\n')) + np.count_nonzero(raw == ord('\r')):
+        if raw[-1] != ord('\n'):
+            raw = np.concatenate((raw, np.array([ord('\n')], dtype=np.uint8)))
+        return _parse_lines(raw)
+
+    if separators == raw.size:
+        return np.zeros(0, dtype=np.uint16), 0
+
+    # Clean input: numpy's C text parser does the conversion. Two samples
+    # run together by a lost newline show up as one value above 65535.
+    values = np.fromstring(data, dtype=np.int64, sep='\n')
+    overflow = values > 0xFFFF
+    if np.any(overflow):
+        return values[~overflow].astype(np.uint16), int(np.count_nonzero(overflow))
+    return values.astype(np.uint16), 0
+
+
+class LineSplitter:
+    # Turns a byte stream of decimal lines, read in arbitrary pieces, into
+    # samples: feed() parses every line completed so far and keeps the
+    # partial last one for the next call. Both return (samples, number of
+    # dropped lines) as parse_samples() does.
+    def __init__(self):
+        self.pending = b""
+
+    def feed(self, data):
+        self.pending += data
+        cut = self.pending.rfind(b'\n') + 1
+        if not cut:
+            return np.zeros(0, dtype=np.uint16), 0
+        lines, self.pending = self.pending[:cut], self.pending[cut:]
+        return parse_samples(lines)
+
+    def flush(self):
+        # The last line of a capture that does not end in a newline.
+        lines, self.pending = self.pending, b""
+        return parse_samples(lines)
+
+
+def load_text_capture(file_path, start=0, end=None):
+    # Loads the samples whose lines begin inside the byte range [start, end).
+    with open(file_path, 'rb') as file:
+        if start > 0:
+            file.seek(start - 1)
+            if file.read(1) != b'\n':
+                file.readline()
+        offset = file.tell()
+        if end is None:
+            data = file.read()
+        else:
+            data = file.read(max(0, end - offset))
+            if data and not data.endswith(b'\n'):
+                data += file.readline()
+    return parse_samples(data)
+
+
+def load_capture(file_path):
+    # Returns (samples, nominal sampling rate) for a binary or text capture.
+    if is_binary_capture(file_path):
+        capture = open_capture(file_path)
+        return capture.samples, capture.sampling_rate
+
+    samples, _ = load_text_capture(file_path)
+    return samples, 1 / DEFAULT_SAMPLE_PERIOD
+
+
+def load_samples(file_path):
+    return load_capture(file_path)[0]
+
+
+def read_binary_capture_chunks(file_path, chunk_size=4096, follow=False, poll_interval=0.2):
+    header = read_header(file_path)
+    with open(file_path, 'rb') as file:
+        file.seek(header["header_size"])
+        pending = b""
+        while True:
+            data = file.read(chunk_size * SAMPLE_DTYPE.itemsize)
+            if not data:
+                if not follow:
+                    break
+                time.sleep(poll_interval)
+                continue
+            pending += data
+            usable = len(pending) - len(pending) % SAMPLE_DTYPE.itemsize
+            if usable:
+                yield np.frombuffer(pending[:usable], dtype=SAMPLE_DTYPE).astype(np.float64)
+                pending = pending[usable:]
+
+
+def read_capture_chunks(file_path, chunk_size=4096, follow=False, poll_interval=0.2):
+    if is_binary_capture(file_path):
+        yield from read_binary_capture_chunks(file_path, chunk_size, follow, poll_interval)
+        return
+    with open(file_path, 'rb') as file:
+        lines = LineSplitter()
+        while True:
+            data = file.read(chunk_size * 5)
+            if not data:
+                if not follow:
+                    break
+                time.sleep(poll_interval)
+                continue
+            samples, _ = lines.feed(data)
+            if samples.size:
+                yield samples.astype(np.float64)
+        samples, _ = lines.flush()
+        if samples.size:
+            yield samples.astype(np.float64)
+
+
+def convert_text_capture(text_path, binary_path, sample_period=DEFAULT_SAMPLE_PERIOD, port="",
+                         block_bytes=1 << 22):
+    skipped = 0
+    size = os.path.getsize(text_path)
+    with CaptureWriter(binary_path, sample_period=sample_period, port=port, start_time=0.0) as writer:
+        for start in range(0, size, block_bytes):
+            samples, bad = load_text_capture(text_path, start, start + block_bytes)
+            writer.write(samples)
+            skipped += bad
+    return writer.sample_count, skipped
+
+
+def main(argv):
+    if len(argv) != 2:
+        print("Usage: python -m fskdecoder convert <capture.txt> <capture.bin>")
+        return 1
+    count, skipped = convert_text_capture(argv[0], argv[1])
+    print(f"Converted {count} samples ({skipped} unreadable lines skipped) to {argv[1]}")
@@ -0,0 +1,116 @@
+import numpy as np
+
+from .filters import highpass_filter, real_dtype
+from .smoothing import moving_average
+from .slicing import bits_to_string, slice_peaks, unpack_bits
+
+
+def analytic_signal(x, n=None):
+    # scipy.signal.hilbert, but with the FFT length chosen by the caller and
+    # the input dtype kept: float32 input gives a complex64 result.
+    from scipy import fft
+
+    x = np.asarray(x)
+    if x.dtype not in (np.float32, np.float64):
+        x = x.astype(np.float64)
+    size = x.size
+    n = n or size
+    spectrum = fft.rfft(x, n)
+    spectrum[1:(n + 1) // 2] *= 2
+    full = np.zeros(n, dtype=spectrum.dtype)
+    full[:spectrum.size] = spectrum
+    return fft.ifft(full, overwrite_x=True)[:size]
+
+
+class StreamingEnvelope:
+    # Overlap-save Hilbert envelope. Each block of `block_size` samples is
+    # transformed together with `overlap` samples of context on either side,
+    # zero padded to a fast FFT length, and only its centre is kept; memory
+    # stays at a few blocks however long the stream is.
+    def __init__(self, block_size=8192, overlap=512, precision='float64'):
+        from scipy.fft import next_fast_len
+
+        self.block_size = block_size
+        self.overlap = overlap
+        self.dtype = real_dtype(precision)
+        self.fft_size = next_fast_len(block_size + 2 * overlap, real=True)
+        # The first block is preceded by `overlap` zeros so that envelope
+        # index == sample index.
+        self._pending = np.zeros(overlap, dtype=self.dtype)
+        self.samples_in = 0
+        self.samples_out = 0
+
+    def process(self, chunk):
+        chunk = np.asarray(chunk, dtype=self.dtype)
+        self.samples_in += chunk.size
+        self._pending = np.concatenate((self._pending, chunk))
+        return self._emit()
+
+    def flush(self):
+        # Pad with zeros to push the last real samples through; _emit() drops
+        # the envelope of the padding itself.
+        self._pending = np.concatenate((self._pending, np.zeros(self.block_size + self.overlap, self.dtype)))
+        return self._emit()
+
+    def _emit(self):
+        span = self.block_size + 2 * self.overlap
+        pieces = []
+        while self._pending.size >= span:
+            analytic = analytic_signal(self._pending[:span], self.fft_size)
+            pieces.append(np.abs(analytic[self.overlap:self.overlap + self.block_size]))
+            self._pending = self._pending[self.block_size:]
+        envelope = np.concatenate(pieces) if pieces else np.zeros(0, self.dtype)
+        envelope = envelope[:max(0, self.samples_in - self.samples_out)]
+        self.samples_out += envelope.size
+        return envelope
+
+
+def iter_envelope(chunks, block_size=8192, overlap=512, precision='float64'):
+    engine = StreamingEnvelope(block_size, overlap, precision)
+    for chunk in chunks:
+        envelope = engine.process(chunk)
+        if envelope.size:
+            yield envelope
+    tail = engine.flush()
+    if tail.size:
+        yield tail
+
+
+def compute_envelope(signal, block_size=1 << 16, overlap=1024, precision='float64'):
+    dtype = real_dtype(precision)
+    signal = np.asarray(signal)
+    if signal.size <= block_size:
+        from scipy.fft import next_fast_len
+
+        return np.abs(analytic_signal(signal.astype(dtype, copy=False), next_fast_len(signal.size, real=True)))
+    envelope = np.empty(signal.size, dtype=dtype)
+    position = 0
+    for piece in iter_envelope((signal[i:i + block_size] for i in range(0, signal.size, block_size)),
+                               block_size, overlap, precision):
+        envelope[position:position + piece.size] = piece
+        position += piece.size
+    return envelope
+
+
+def compute_smoothed_envelope(signal, sampling_rate, cutoff=700, window_size=300, precision='float64'):
+    filtered_signal = highpass_filter(signal, cutoff, sampling_rate, precision=precision)
+
+    envelope = compute_envelope(filtered_signal, precision=precision)
+
+    smoothed_envelope = moving_average(envelope, window_size)
+
+    return smoothed_envelope
+
+
+def extract_bits_from_envelope(smoothed_envelope, segment_start, segment_end, min_height=350, peak_distance=700):
+    from scipy.signal import find_peaks
+
+    peaks, _ = find_peaks(smoothed_envelope[segment_start:segment_end], height=min_height, distance=peak_distance)
+
+    (packed, count), positions, amplitudes = slice_peaks(smoothed_envelope, segment_start + peaks)
+    bits = unpack_bits(packed, count)
+
+    bitstring = bits_to_string(bits)
+    bit_positions = list(zip(positions.tolist(), amplitudes.tolist(), bitstring))
+
+    return bitstring, bit_positions
@@ -0,0 +1,170 @@
+import argparse
+import time
+
+import numpy as np
+
+from .markers import transmission_duration
+from .slicing import count_bit_errors
+from .tones import EFFECTIVE_SAMPLING_RATE
+
+# Hamming(7,4) with block interleaving. Every 4 data bits become a 7-bit
+# codeword that survives any single bit error. Codewords are sent in blocks
+# of `depth`: bit 0 of each codeword, then bit 1 of each, and so on, so a
+# burst of up to `depth` wrong bits (a fading stretch of the channel) still
+# costs each codeword at most one.
+#
+# The code only repairs substituted bits. It needs a decoder that reports a
+# bit for every symbol slot, as decode_frame() does; a dropped bit shifts
+# everything after it.
+DATA_BITS = 4
+CODE_BITS = 7
+INTERLEAVE_DEPTH = 8
+
+# Systematic form: codeword = data bits, then three parity bits.
+GENERATOR = np.array([[1, 0, 0, 0, 1, 1, 0],
+                      [0, 1, 0, 0, 1, 0, 1],
+                      [0, 0, 1, 0, 0, 1, 1],
+                      [0, 0, 0, 1, 1, 1, 1]], dtype=np.uint8)
+PARITY_CHECK = np.array([[1, 1, 0, 1, 1, 0, 0],
+                         [1, 0, 1, 1, 0, 1, 0],
+                         [0, 1, 1, 1, 0, 0, 1]], dtype=np.uint8)
+
+# Syndrome (as a number) -> position of the single wrong bit, -1 if none.
+SYNDROME_POSITION = np.full(8, -1, dtype=np.intp)
+SYNDROME_POSITION[PARITY_CHECK.T @ np.array([4, 2, 1])] = np.arange(CODE_BITS)
+
+
+def hamming_encode(bits):
+    bits = np.asarray(bits, dtype=np.uint8).ravel()
+    data = np.concatenate((bits, np.zeros(-bits.size % DATA_BITS, np.uint8))).reshape(-1, DATA_BITS)
+    return ((data @ GENERATOR) & 1).astype(np.uint8).ravel()
+
+
+def hamming_decode(bits):
+    # Data bits and the number of codewords that had a bit corrected.
+    bits = np.asarray(bits, dtype=np.uint8).ravel()
+    codewords = bits[:bits.size - bits.size % CODE_BITS].reshape(-1, CODE_BITS).copy()
+    syndromes = ((codewords @ PARITY_CHECK.T) & 1) @ np.array([4, 2, 1])
+    positions = SYNDROME_POSITION[syndromes]
+    wrong = np.flatnonzero(positions >= 0)
+    codewords[wrong, positions[wrong]] ^= 1
+    return codewords[:, :DATA_BITS].ravel(), wrong.size
+
+
+def interleave(codes, depth=INTERLEAVE_DEPTH):
+    # Pads with all-zero codewords to whole blocks of `depth` codewords.
+    codes = np.asarray(codes, dtype=np.uint8).ravel()
+    codes = np.concatenate((codes, np.zeros(-codes.size % (depth * CODE_BITS), np.uint8)))
+    return codes.reshape(-1, depth, CODE_BITS).transpose(0, 2, 1).ravel()
+
+
+def deinterleave(bits, depth=INTERLEAVE_DEPTH):
+    # A frame is cut or padded to the nearest whole number of blocks: the
+    # demodulator may miss the last symbol or add one from the noise after it.
+    bits = np.asarray(bits, dtype=np.uint8).ravel()
+    block = depth * CODE_BITS
+    size = max(int(np.round(bits.size / block)), 1) * block
+    bits = np.concatenate((bits[:size], np.zeros(size - min(bits.size, size), np.uint8)))
+    return bits.reshape(-1, CODE_BITS, depth).transpose(0, 2, 1).ravel()
+
+
+def fec_encode(bits, depth=INTERLEAVE_DEPTH):
+    return interleave(hamming_encode(bits), depth)
+
+
+def fec_decode(bits, depth=INTERLEAVE_DEPTH):
+    # (data bits, corrected codewords). The data keeps the zero padding of
+    # the last block; payloads carry their own length.
+    return hamming_decode(deinterleave(bits, depth))
+
+
+def coded_length(bit_count, depth=INTERLEAVE_DEPTH):
+    codewords = -(-bit_count // DATA_BITS)
+    return -(-codewords // depth) * depth * CODE_BITS
+
+
+def bsc_trials(bit_count, ber, trials, depth, rng):
+    # Fraction of `trials` frames of `bit_count` data bits that arrive
+    # without error over a binary symmetric channel, uncoded and coded.
+    data = rng.integers(0, 2, (trials, bit_count), dtype=np.uint8)
+    plain_ok = ~np.any(rng.random(data.shape) < ber, axis=1)
+    # Frames padded to whole interleaver blocks code independently, so the
+    # whole batch goes through the codec as one long message.
+    padded = np.zeros((trials, coded_length(bit_count, depth) // CODE_BITS * DATA_BITS), np.uint8)
+    padded[:, :bit_count] = data
+    sent = fec_encode(padded.ravel(), depth)
+    received = sent ^ (rng.random(sent.shape) < ber)
+    decoded = fec_decode(received, depth)[0].reshape(trials, -1)[:, :bit_count]
+    coded_ok = np.all(decoded == data, axis=1)
+    return plain_ok.mean(), coded_ok.mean()
+
+
+def capture_trials(bit_count, noise, trials, depth, seed):
+    # Sends `trials` frames, uncoded and coded, through ChannelSimulator and
+    # decode_frame(). Returns (raw BER, uncoded frames ok, coded frames ok).
+    from .frames import iter_frames
+    from .simulate import ChannelSimulator, random_frames
+    from .slicing import unpack_bits
+
+    results = []
+    raw_errors = raw_bits = 0
+    for coded in (False, True):
+        frames = random_frames(trials, bit_count, seed)
+        sent = [fec_encode(bits, depth) if coded else bits for bits in frames]
+        # One second of silence before every frame, two after the last.
+        duration = sum(1.0 + transmission_duration(bits.size) for bits in sent) + 2
+        simulator = ChannelSimulator(sent, duration * EFFECTIVE_SAMPLING_RATE, idle=1.0, noise=noise, seed=seed)
+        decoded = [unpack_bits(frame["bits"], frame["bit_count"]) for frame in iter_frames(simulator.chunks())]
+        ok = 0
+        for index, (_, _, bits) in enumerate(simulator.spans):
+            received = decoded[index] if index < len(decoded) else np.zeros(0, np.uint8)
+            # Payloads carry their length, so symbols after it do not count.
+            raw_errors += count_bit_errors(received[:bits.size], bits)
+            raw_bits += bits.size
+            if not coded:
+                received = received[:bits.size]
+            data = fec_decode(received, depth)[0][:bit_count] if coded else received
+            ok += count_bit_errors(data, frames[index]) == 0
+        results.append(ok / max(len(simulator.spans), 1))
+    return raw_errors / max(raw_bits, 1), results[0], results[1]
+
+
+def goodput(ok, bit_count, sent_bits):
+    # Data bits per second of airtime (start marker included) when every
+    # failed frame is sent again.
+    return ok * bit_count / transmission_duration(sent_bits)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m fskdecoder fec",
+                                     description="Goodput of the legacy link with and without Hamming(7,4) "
+                                                 "and interleaving.")
+    parser.add_argument("--bits", type=int, default=64, help="data bits per frame")
+    parser.add_argument("--depth", type=int, default=INTERLEAVE_DEPTH, help="interleaver depth in codewords")
+    parser.add_argument("--ber", type=float, nargs="+", default=[1e-3, 3e-3, 1e-2, 3e-2, 1e-1],
+                        help="channel bit error rates for the binary symmetric channel sweep")
+    parser.add_argument("--trials", type=int, default=2000)
+    parser.add_argument("--noise", type=float, nargs="*", default=[],
+                        help="also send frames through simulated captures with these noise levels [ADC counts]")
+    parser.add_argument("--capture-trials", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    sent_bits = coded_length(args.bits, args.depth)
+    print(f"{args.bits} data bits per frame: {args.bits} bits uncoded, {sent_bits} bits coded "
+          f"(depth {args.depth})")
+    print(f"{'channel':>16} {'BER':>9} {'frames ok':>19} {'goodput [bit/s]':>19}")
+    print(f"{'':>16} {'':>9} {'plain':>9} {'coded':>9} {'plain':>9} {'coded':>9}")
+
+    def row(channel, ber, plain_ok, coded_ok):
+        print(f"{channel:>16} {ber:>9.2e} {plain_ok:>9.3f} {coded_ok:>9.3f} "
+              f"{goodput(plain_ok, args.bits, args.bits):>9.3f} {goodput(coded_ok, args.bits, sent_bits):>9.3f}")
+
+    started = time.perf_counter()
+    for ber in args.ber:
+        row("symmetric", ber, *bsc_trials(args.bits, ber, args.trials, args.depth, rng))
+    for noise in args.noise:
+        row(f"capture {noise:g}", *capture_trials(args.bits, noise, args.capture_trials, args.depth, args.seed))
+    print(f"({time.perf_counter() - started:.1f} s)")
+    return 0
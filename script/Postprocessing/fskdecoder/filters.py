@@ -0,0 +1,71 @@
+from functools import lru_cache
+
+import numpy as np
+
+
+def design_filter(order, cutoff, fs, btype='high'):
+    # Normalise the key so that equal designs hit the same cache entry however
+    # they were spelled (700 vs 700.0, list vs tuple band edges, keywords).
+    cutoff = float(cutoff) if np.isscalar(cutoff) else tuple(float(edge) for edge in cutoff)
+    return _design_filter(int(order), cutoff, float(fs), btype)
+
+
+@lru_cache(maxsize=64)
+def _design_filter(order, cutoff, fs, btype):
+    # Butterworth design in second-order sections. The array is shared by
+    # every caller with the same (order, cutoff, fs, btype); do not modify it.
+    # (It cannot be flagged read-only: scipy's sosfilt rejects such buffers.)
+    from scipy.signal import butter
+
+    nyquist = 0.5 * fs
+    normal_cutoff = np.asarray(cutoff, dtype=np.float64) / nyquist
+    return butter(order, normal_cutoff, btype=btype, analog=False, output='sos')
+
+
+def real_dtype(precision):
+    # 'float32' or 'float64' (or the dtypes themselves) -> numpy dtype.
+    dtype = np.dtype(precision)
+    if dtype not in (np.float32, np.float64):
+        raise ValueError(f"Unsupported precision {precision!r}, use 'float32' or 'float64'")
+    return dtype
+
+
+def apply_filter(data, cutoff, fs, order=5, btype='high', zero_phase=True, precision='float64'):
+    from scipy.signal import sosfilt, sosfiltfilt
+
+    dtype = real_dtype(precision)
+    # scipy filters in the common type of coefficients and data, so the
+    # coefficients are cast as well to keep a float32 path in float32.
+    sos = design_filter(order, cutoff, fs, btype).astype(dtype, copy=False)
+    data = np.asarray(data, dtype=dtype)
+    if zero_phase:
+        return sosfiltfilt(sos, data)
+    return sosfilt(sos, data)
+
+
+def highpass_filter(data, cutoff, fs, order=5, zero_phase=True, precision='float64'):
+    return apply_filter(data, cutoff, fs, order, 'high', zero_phase, precision)
+
+
+class StreamingFilter:
+    # Causal filter that carries its state from one chunk to the next, so a
+    # chunked run gives the same output as one sosfilt() over the whole stream.
+    def __init__(self, cutoff, fs, order=5, btype='high', precision='float64'):
+        self.dtype = real_dtype(precision)
+        self.sos = design_filter(order, cutoff, fs, btype).astype(self.dtype, copy=False)
+        self.zi = None
+
+    def process(self, chunk):
+        from scipy.signal import sosfilt, sosfilt_zi
+
+        chunk = np.asarray(chunk, dtype=self.dtype)
+        if chunk.size == 0:
+            return chunk
+        if self.zi is None:
+            # Start settled on the first sample instead of ringing up from zero.
+            self.zi = (sosfilt_zi(self.sos) * chunk[0]).astype(self.dtype)
+        filtered, self.zi = sosfilt(self.sos, chunk, zi=self.zi)
+        return filtered
+
+    def reset(self):
+        self.zi = None
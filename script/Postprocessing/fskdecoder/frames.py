@@ -0,0 +1,163 @@
+import numpy as np
+
+from .markers import SYMBOL_PERIOD, TONE_DURATION, FrameScanner, estimate_sampling_rate, window_rms
+from .slicing import bits_to_string, unpack_bits
+from .tones import EFFECTIVE_SAMPLING_RATE, ToneDetector, symbol_starts, symbol_windows, tone_powers
+from .tracking import AdaptiveThreshold
+
+
+def symbol_timing(signal, start, end, period, window_length, rms_window=32):
+    # Fold the short-time level of the frame onto one symbol period and slide
+    # the symbol window around it: the phase with the most energy inside the
+    # window is where every tone sits, wherever the frame started.
+    segment = np.asarray(signal[start:end], dtype=np.float64)
+    segment = segment - segment.mean()
+    level = window_rms(segment, rms_window)
+
+    bins = int(round(period))
+    phase = (np.arange(level.size) % period).astype(np.intp)
+    counts = np.bincount(phase, minlength=bins)[:bins]
+    profile = np.bincount(phase, weights=level, minlength=bins)[:bins] / np.maximum(counts, 1)
+
+    box = np.zeros(bins)
+    box[:min(window_length, bins)] = 1.0
+    # Circular correlation, so windows that wrap past the period count too.
+    energy = np.real(np.fft.ifft(np.fft.fft(profile) * np.conj(np.fft.fft(box))))
+    first = start + int(np.argmax(energy)) + rms_window // 2
+
+    count = int((end - window_length - first) // period) + 1
+    if count <= 0:
+        return first, 0
+
+    # Slots at the tail that hold no tone are just the silence after the frame.
+    level = symbol_windows(signal, symbol_starts(first, count, period), window_length).std(axis=1)
+    active = np.flatnonzero(level >= 0.25 * np.median(level))
+    return first, int(active[-1]) + 1 if active.size else 0
+
+
+def decode_frame(signal, frame, sampling_rate=None):
+    if sampling_rate is None:
+        sampling_rate = estimate_sampling_rate(signal, (frame["marker_start"], frame["start"]))
+    period = SYMBOL_PERIOD * sampling_rate
+    detector = ToneDetector(sampling_rate=sampling_rate,
+                            symbol_length=int(0.9 * TONE_DURATION * sampling_rate))
+
+    first, count = symbol_timing(signal, frame["start"], frame["end"], period,
+                                 detector.symbol_length)
+    starts = symbol_starts(first, count, period)
+    (packed, bit_count), power_0, power_1 = detector.detect(signal, starts)
+
+    # Weakest symbol decision in dB: how far the winning tone stood above
+    # the other one.
+    margin = np.abs(10 * np.log10(np.maximum(power_1, 1e-12) / np.maximum(power_0, 1e-12)))
+    return {
+        "marker_start": frame["marker_start"],
+        "start": frame["start"],
+        "end": frame["end"],
+        "first_symbol": first,
+        "sampling_rate": sampling_rate,
+        "symbol_period": period,
+        "bit_count": bit_count,
+        "duration": (frame["end"] - frame["marker_start"]) / sampling_rate,
+        "bits": packed,
+        "tone_margin_db": float(margin.min()) if bit_count and detector.resolvable else None,
+    }
+
+
+class SymbolStream:
+    # Symbol decisions of a frame that is still being received, for showing
+    # its payload before it is over. The timing is taken from
+    # symbol_timing() once `acquire_symbols` periods have arrived and kept
+    # from then on, and a symbol is decided as soon as the scanner has seen
+    # tone activity past its window. When the two tones are not resolvable
+    # AdaptiveThreshold slices the amplitudes, holding the first few back.
+    # decode_frame() decodes the complete frame again; its bits are the ones
+    # that count.
+    def __init__(self, scanner, frame, acquire_symbols=4):
+        self.scanner = scanner
+        self.marker_start, self.start = frame["marker_start"], frame["start"]
+        marker = scanner.signal(self.marker_start, self.start)
+        self.sampling_rate = estimate_sampling_rate(marker, (0, marker.size))
+        self.period = SYMBOL_PERIOD * self.sampling_rate
+        self.detector = ToneDetector(sampling_rate=self.sampling_rate,
+                                     symbol_length=int(0.9 * TONE_DURATION * self.sampling_rate))
+        self.threshold = AdaptiveThreshold()
+        self.acquire_symbols = acquire_symbols
+        self.first = None
+        self.count = 0
+
+    def update(self, end):
+        # Bits of the symbols that ended before `end`, the frame's last
+        # active sample so far, and were not reported yet.
+        length = self.detector.symbol_length
+        if self.first is None:
+            if end - self.start < self.acquire_symbols * self.period:
+                return np.zeros(0, dtype=np.uint8)
+            signal = self.scanner.signal(self.start, end)
+            self.first = self.start + symbol_timing(signal, 0, signal.size, self.period, length)[0]
+        count = max(int((end - length - self.first) // self.period) + 1, 0)
+        if count <= self.count:
+            return np.zeros(0, dtype=np.uint8)
+        starts = symbol_starts(self.first, count, self.period)[self.count:]
+        self.count = count
+        base = int(starts[0])
+        windows = symbol_windows(self.scanner.signal(base, int(starts[-1]) + length), starts - base, length)
+        # A few windows at a time: one matrix product beats the Goertzel loop.
+        power_0, power_1 = tone_powers(windows, [self.detector.frequency_0, self.detector.frequency_1]).T
+        if self.detector.resolvable:
+            return (power_1 > power_0).astype(np.uint8)
+        return np.array([bit for amplitude in np.sqrt(power_0) for bit in self.threshold.update(amplitude)],
+                        dtype=np.uint8)
+
+
+def iter_frames(chunks, max_frame_seconds=3600, sampling_rate=EFFECTIVE_SAMPLING_RATE, on_symbols=None):
+    # Generator over every frame in a stream of sample chunks. FrameScanner
+    # looks at every sample once and keeps only the samples of the frame
+    # being assembled; a frame is decoded once the silence after it (or the
+    # next marker) has arrived. A frame cut off at `max_frame_seconds` comes
+    # with "truncated" set; the rest of that transmission is dropped.
+    #
+    # on_symbols(marker_start, bits), if given, gets the symbol decisions of
+    # the frame in progress after every chunk (see SymbolStream).
+    scanner = FrameScanner(sampling_rate, max_frame_seconds=max_frame_seconds)
+    symbols = None
+
+    def emit(frame):
+        offset = frame["marker_start"]
+        relative = {key: frame[key] - offset for key in ("marker_start", "start", "end")}
+        decoded = decode_frame(scanner.signal(offset, frame["end"]), relative)
+        for key in ("marker_start", "start", "end", "first_symbol"):
+            decoded[key] += offset
+        decoded["truncated"] = frame["truncated"]
+        return decoded
+
+    for chunk in chunks:
+        for frame in scanner.feed(chunk):
+            yield emit(frame)
+        if on_symbols is None:
+            continue
+        frame = scanner.open_frame
+        if frame is None:
+            symbols = None
+            continue
+        if symbols is None or symbols.marker_start != frame["marker_start"]:
+            symbols = SymbolStream(scanner, frame)
+        bits = symbols.update(frame["end"])
+        if bits.size:
+            on_symbols(frame["marker_start"], bits)
+    for frame in scanner.flush():
+        yield emit(frame)
+
+
+def main(argv):
+    if len(argv) != 1:
+        print("Usage: python -m fskdecoder frames <capture>")
+        return 1
+
+    from .capturefile import read_capture_chunks
+
+    for frame in iter_frames(read_capture_chunks(argv[0], chunk_size=1 << 16)):
+        bitstring = bits_to_string(unpack_bits(frame["bits"], frame["bit_count"]))
+        truncated = " (truncated)" if frame["truncated"] else ""
+        print(f"Frame at sample {frame['start']}: {frame['bit_count']} bits{truncated}, "
+              f"{frame['duration']:.1f} s, {frame['sampling_rate']:.0f} Hz -> {bitstring}")
@@ -0,0 +1,43 @@
+import numpy as np
+
+
+def binary_string_to_image(binary_string, width=8):
+    height = len(binary_string) // width
+    if len(binary_string) % width != 0:
+        height += 1
+
+    padded_binary_string = binary_string.ljust(width * height, '0')
+
+    binary_array = np.array(list(map(int, padded_binary_string))).reshape((height, width))
+
+    return binary_array
+
+
+def payload_to_image(binary_string, width=8, fec_depth=None):
+    # Image of a payload from Preprocessing/encodeImage.py, levels scaled to
+    # 0..1. Plain and tiled payloads are recognised, with or without forward
+    # error correction (interleaver depth `fec_depth`, default
+    # fec.INTERLEAVE_DEPTH); of a tiled payload, whatever tiles arrived are
+    # shown. Bitstrings without a payload header (the legacy sender's) are
+    # laid out `width` pixels per row as before.
+    from .fec import INTERLEAVE_DEPTH, fec_decode
+    from .payload import decode_payload
+    from .slicing import string_to_bits
+    from .tiles import decode_tiles
+
+    bits = string_to_bits(binary_string)
+    for coded in (False, True):
+        if coded:
+            bits = fec_decode(bits, fec_depth or INTERLEAVE_DEPTH)[0]
+        try:
+            image, depth = decode_payload(bits, padded=coded)
+            return image / ((1 << depth) - 1)
+        except ValueError:
+            pass
+        try:
+            reconstructor, received = decode_tiles(bits)
+        except ValueError:
+            continue
+        if received:
+            return reconstructor.preview()
+    return binary_string_to_image(binary_string, width)
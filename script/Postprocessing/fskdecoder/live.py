@@ -0,0 +1,233 @@
+import argparse
+import bisect
+import collections
+import os
+import time
+
+import numpy as np
+
+from .capturefile import LineSplitter, read_capture_chunks
+from .frames import iter_frames
+from .image import payload_to_image
+from .markers import transmission_duration
+from .slicing import bits_to_string, string_to_bits, unpack_bits
+from .tiles import TileReconstructor
+from .tones import EFFECTIVE_SAMPLING_RATE
+
+# Capture, demodulation and image stages chained as generators in one
+# process: each frame is turned into an image as soon as iter_frames() sees
+# the silence after its last bit, instead of after the capture is stopped.
+# A tiled payload sent without FEC is shown while it arrives: the symbol
+# decisions of the frame in progress go to a TileReconstructor, and every
+# tile appears once its unit has passed the CRC. Interleaved (FEC) and
+# untiled payloads can only be shown once the frame is over.
+
+
+def serial_chunks(port, baud_rate=115200, read_size=1 << 14):
+    # Samples from the receiver as scanSerialPort.py reads them: bulk reads,
+    # whole lines parsed at once, a partial line kept for the next read.
+    import serial
+
+    with serial.Serial(port, baud_rate, timeout=0.1) as ser:
+        lines = LineSplitter()
+        while True:
+            samples, _ = lines.feed(ser.read(max(read_size, ser.in_waiting)))
+            if samples.size:
+                yield samples
+
+
+def simulated_chunks(simulator, speed=1.0, chunk_size=256):
+    # ChannelSimulator output released at `speed` times the receiver's sample
+    # rate (0: as fast as it is produced).
+    started = time.monotonic()
+    produced = 0
+    for chunk in simulator.chunks(chunk_size):
+        produced += chunk.size
+        if speed:
+            delay = started + produced / (simulator.sampling_rate * speed) - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        yield chunk
+
+
+class LiveStats:
+    # Per-stage bookkeeping. `arrivals` maps the end of every chunk (in
+    # samples) to the time it was handed to the decoder, so a frame's last
+    # bit can be dated; `busy` is the wall time spent inside each stage.
+    def __init__(self, max_chunks=1 << 16):
+        self.arrivals = collections.deque(maxlen=max_chunks)
+        self.samples = 0
+        self.busy = {"capture": 0.0, "demodulate": 0.0, "image": 0.0}
+        self.latencies = []
+
+    def timed(self, chunks):
+        chunks = iter(chunks)
+        while True:
+            started = time.monotonic()
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                return
+            now = time.monotonic()
+            self.busy["capture"] += now - started
+            self.samples += len(chunk)
+            self.arrivals.append((self.samples, now))
+            yield chunk
+
+    def arrival(self, sample):
+        # When the chunk holding `sample` arrived; older chunks are forgotten.
+        ends = [end for end, _ in self.arrivals]
+        index = min(bisect.bisect_right(ends, sample), len(ends) - 1)
+        arrived = self.arrivals[index][1]
+        for _ in range(index):
+            self.arrivals.popleft()
+        return arrived
+
+
+def decode_live(chunks, width=8, output_dir=None, show=False, stats=None):
+    # Generator over (frame, bitstring, image, latency) for every frame in
+    # `chunks`. latency holds the seconds from the arrival of the frame's last
+    # symbol to the frame being decoded ("demodulate") and to its image being
+    # ready ("image"). The demodulator answers once the silence after the
+    # frame is in, so expect about 2 symbol periods of it. For a tiled
+    # payload, "first tile" is when its first tile could be shown, relative
+    # to the same last symbol (negative: that long before it).
+    stats = stats or LiveStats()
+    figure = None
+    count = 0
+    tiles = {"marker_start": None, "reconstructor": None, "first": None}
+
+    def show_tiles(marker_start, bits):
+        nonlocal figure
+        if tiles["marker_start"] != marker_start:
+            tiles.update(marker_start=marker_start, reconstructor=TileReconstructor(), first=None)
+        reconstructor = tiles["reconstructor"]
+        if reconstructor is None:
+            return
+        started = time.monotonic()
+        try:
+            updates = reconstructor.feed(bits)
+        except ValueError:
+            # No tiled payload (or its header was hit): wait for the frame.
+            tiles["reconstructor"] = None
+            return
+        if any(ok for _, _, ok in updates):
+            if tiles["first"] is None:
+                tiles["first"] = time.monotonic()
+            if show:
+                import matplotlib.pyplot as plt
+
+                if figure is None:
+                    figure = plt.figure(figsize=(4, 4))
+                figure.clf()
+                axis = figure.add_subplot()
+                axis.imshow(reconstructor.preview(), cmap='gray', vmin=0, vmax=1)
+                axis.set_title(f"Frame {count}: {int(reconstructor.received.sum())}/{reconstructor.unit_count} tiles")
+                axis.axis("off")
+                plt.pause(0.001)
+        stats.busy["image"] += time.monotonic() - started
+
+    frames = iter_frames(stats.timed(chunks), on_symbols=show_tiles)
+    while True:
+        started = time.monotonic()
+        waited, drawn = stats.busy["capture"], stats.busy["image"]
+        try:
+            frame = next(frames)
+        except StopIteration:
+            return
+        decoded = time.monotonic()
+        # Time spent waiting for samples is the capture stage's, and drawing
+        # tiles in between the image stage's.
+        stats.busy["demodulate"] += decoded - started - (stats.busy["capture"] - waited) - (
+            stats.busy["image"] - drawn)
+        last_bit = stats.arrival(int(frame["first_symbol"] + frame["bit_count"] * frame["symbol_period"]))
+
+        bitstring = bits_to_string(unpack_bits(frame["bits"], frame["bit_count"]))
+        image = payload_to_image(bitstring, width=width) if bitstring else np.zeros((0, width))
+        if output_dir and image.size:
+            import matplotlib.pyplot as plt
+
+            plt.imsave(os.path.join(output_dir, f"frame_{count:04d}.png"), image, cmap='gray', vmin=0, vmax=1)
+        if show and image.size:
+            import matplotlib.pyplot as plt
+
+            if figure is None:
+                figure = plt.figure(figsize=(4, 4))
+            figure.clf()
+            axis = figure.add_subplot()
+            axis.imshow(image, cmap='gray', vmin=0, vmax=1)
+            axis.set_title(f"Frame {count}: {bitstring}")
+            axis.axis("off")
+            plt.pause(0.001)
+        done = time.monotonic()
+        stats.busy["image"] += done - decoded
+
+        latency = {"demodulate": decoded - last_bit, "image": done - last_bit, "first tile": None}
+        if tiles["marker_start"] == frame["marker_start"] and tiles["first"] is not None:
+            latency["first tile"] = tiles["first"] - last_bit
+        stats.latencies.append(latency)
+        count += 1
+        yield frame, bitstring, image, latency
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m fskdecoder live",
+                                     description="Capture, demodulate and show images in one pipeline.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--port", help="serial port of the receiver")
+    source.add_argument("--follow", metavar="CAPTURE", help="capture file that is still being written")
+    source.add_argument("--simulate", metavar="BITS", nargs="?", const="",
+                        help="simulated receiver sending BITS (random 8-bit frames if omitted)")
+    parser.add_argument("--baud", type=int, default=115200)
+    parser.add_argument("--width", type=int, default=8, help="image width of frames without a payload header")
+    parser.add_argument("--output-dir", help="save every frame as frame_NNNN.png here")
+    parser.add_argument("--show", action="store_true", help="show every frame as it is decoded")
+    parser.add_argument("--frames", type=int, default=0, help="stop after this many frames (0 = never)")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="simulated samples per real-time sample (0 = as fast as possible)")
+    args = parser.parse_args(argv)
+
+    if args.port:
+        chunks = serial_chunks(args.port, args.baud)
+    elif args.follow:
+        chunks = read_capture_chunks(args.follow, chunk_size=256, follow=True)
+    else:
+        from .simulate import ChannelSimulator, random_frames
+
+        if args.simulate:
+            frames = [string_to_bits(args.simulate)]
+        else:
+            frames = random_frames(64, 8)
+        count = args.frames or len(frames)
+        # Long enough for `count` frames after a second of silence each, with
+        # the silence that ends the last.
+        duration = sum(1.0 + transmission_duration(frames[i % len(frames)].size) for i in range(count)) + 2
+        simulator = ChannelSimulator(frames, duration * EFFECTIVE_SAMPLING_RATE, idle=1.0)
+        chunks = simulated_chunks(simulator, args.speed)
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    stats = LiveStats()
+    started = time.monotonic()
+    try:
+        for count, (frame, bitstring, image, latency) in enumerate(
+                decode_live(chunks, args.width, args.output_dir, args.show, stats), 1):
+            truncated = " (truncated)" if frame["truncated"] else ""
+            first_tile = "" if latency["first tile"] is None else f", first tile {latency['first tile']:+.2f} s"
+            print(f"Frame {count} at sample {frame['start']}{truncated}: {bitstring} "
+                  f"({image.shape[0]}x{image.shape[1]}) | "
+                  f"last bit -> decoded {latency['demodulate']:.2f} s, -> image {latency['image']:.2f} s"
+                  f"{first_tile}")
+            if count == args.frames:
+                break
+    except KeyboardInterrupt:
+        print("Stopping live decode.")
+
+    elapsed = time.monotonic() - started
+    print(f"{len(stats.latencies)} frames, {stats.samples} samples in {elapsed:.1f} s")
+    print("Time per stage: " + ", ".join(f"{stage} {seconds:.2f} s" for stage, seconds in stats.busy.items()))
+    if stats.latencies:
+        for stage in ("demodulate", "image"):
+            values = np.array([latency[stage] for latency in stats.latencies])
+            print(f"Latency to {stage}: mean {values.mean():.2f} s, max {values.max():.2f} s")
+    return 0
@@ -0,0 +1,309 @@
+import numpy as np
+
+from .tones import EFFECTIVE_SAMPLING_RATE, FREQUENCY_0, FREQUENCY_1, START_MARKER_FREQUENCY, aliased_frequency
+
+# Schedule of testAudioSender.ino, in seconds. sendStartMarker() keys
+# 1200 Hz for START_MARKER_DURATION, then waits MARKER_GAP before the first
+# bit. sendBit() takes PTT down, waits PTT_DELAY, keys the tone for
+# TONE_DURATION (BIT_DURATION in the sketch), waits PTT_DELAY, releases PTT
+# and pauses for PAUSE_DURATION: SYMBOL_PERIOD in all.
+START_MARKER_DURATION = 0.5
+MARKER_GAP = 0.05
+TONE_DURATION = 0.3
+PTT_DELAY = 0.01
+PAUSE_DURATION = 0.02
+SYMBOL_PERIOD = TONE_DURATION + 2 * PTT_DELAY + PAUSE_DURATION
+
+
+def transmission_duration(bit_count):
+    # Seconds on air of one frame of `bit_count` bits, start marker included.
+    return START_MARKER_DURATION + MARKER_GAP + bit_count * SYMBOL_PERIOD
+
+
+def window_rms(block, window):
+    cumulative = np.concatenate(([0.0], np.cumsum(block * block)))
+    cumulative_mean = np.concatenate(([0.0], np.cumsum(block)))
+    energy = cumulative[window:] - cumulative[:-window]
+    mean = (cumulative_mean[window:] - cumulative_mean[:-window]) / window
+    return np.sqrt(np.maximum(energy / window - mean * mean, 1e-12))
+
+
+def tone_purity(signal, normalized_frequency, window=256, chunk_size=1 << 20):
+    # Sliding single-bin DFT of every `window`-sample span, divided by the
+    # span's RMS: ~1 for a clean tone at the frequency, ~0 for anything else.
+    # Computed with overlap-add convolution in chunks so memory is bounded.
+    from scipy.signal import oaconvolve
+
+    signal = np.asarray(signal)
+    kernel = np.exp(2j * np.pi * normalized_frequency * np.arange(window))
+    outputs = []
+    levels = []
+    for start in range(0, max(signal.size - window + 1, 0), chunk_size):
+        block = signal[start:start + chunk_size + window - 1].astype(np.float64)
+        block = block - block.mean()
+        magnitude = np.abs(oaconvolve(block, kernel, mode='valid'))
+        rms = window_rms(block, window)
+        outputs.append(np.sqrt(2.0) * magnitude / (window * rms))
+        levels.append(rms)
+    if not outputs:
+        return np.zeros(0), np.zeros(0)
+    return np.concatenate(outputs), np.concatenate(levels)
+
+
+def tone_level(signal, normalized_frequencies, window=256):
+    # Amplitude of the strongest of the given tones in every `window`-sample
+    # span: a sliding single-bin DFT per frequency with the span's mean taken
+    # out. Broadband noise adds only about sqrt(2 / window) of its RMS, so
+    # unlike window_rms() this stays low between transmissions on a noisy
+    # channel.
+    from scipy.signal import oaconvolve
+
+    signal = np.asarray(signal, dtype=np.float64)
+    if signal.size < window:
+        return np.zeros(0)
+    cumulative = np.concatenate(([0.0], np.cumsum(signal)))
+    mean = (cumulative[window:] - cumulative[:-window]) / window
+    level = np.zeros(mean.size)
+    for frequency in normalized_frequencies:
+        kernel = np.exp(2j * np.pi * frequency * np.arange(window))
+        level = np.maximum(level, np.abs(oaconvolve(signal, kernel, mode='valid') - mean * kernel.sum()))
+    return np.sqrt(2.0) * level / window
+
+
+def _runs(mask):
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def find_markers(signal, sampling_rate=EFFECTIVE_SAMPLING_RATE, frequency=START_MARKER_FREQUENCY,
+                 duration=START_MARKER_DURATION, window=256, min_purity=0.8, min_level=20):
+    purity, level = tone_purity(signal, aliased_frequency(frequency, sampling_rate), window)
+    starts, ends = _runs((purity >= min_purity) & (level >= min_level))
+
+    # A window is only pure while it sits completely inside the marker, so a
+    # full-length marker yields a run of about duration * fs - window starts.
+    min_run = 0.6 * (duration * sampling_rate - window)
+    markers = []
+    for start, end in zip(starts, ends):
+        if end - start >= min_run:
+            markers.append((int(start), int(end - 1 + window)))
+    return markers
+
+
+def find_frames(signal, sampling_rate=EFFECTIVE_SAMPLING_RATE, window=256, silence=2.0, **kwargs):
+    # Each frame runs from the end of a start marker to the last sample where
+    # one of the symbol tones is keyed before `silence` symbol periods
+    # without (or the next marker). The whole signal in one FrameScanner
+    # feed, so offline and streaming decoders delimit frames alike.
+    scanner = FrameScanner(sampling_rate, window=window, silence=silence, **kwargs)
+    return scanner.feed(signal) + scanner.flush()
+
+
+def _extend_runs(mask, base, open_start):
+    # Runs of a mask continuing an earlier one: (start, end) of every run
+    # that closed, absolute, and the start of the run still open at the end.
+    starts, ends = _runs(mask)
+    starts, ends = (base + starts).tolist(), (base + ends).tolist()
+    if open_start is not None:
+        if starts and starts[0] == base:
+            starts[0] = open_start
+        else:
+            starts.insert(0, open_start)
+            ends.insert(0, base)
+    still_open = mask[-1] if mask.size else open_start is not None
+    if still_open:
+        return list(zip(starts[:-1], ends[:-1])), starts[-1]
+    return list(zip(starts, ends)), None
+
+
+class FrameScanner:
+    # find_frames() for a stream of sample chunks. Every sample is checked
+    # once, for the start marker and, inside a frame, for activity: a quarter
+    # of the marker's amplitude at any of `tones` (Hz), so noise after a
+    # frame does not extend it. Symbols much shorter than `window` smear
+    # over several bins; for those, tones=None measures the RMS instead,
+    # noise included. The cost per chunk does not grow with the frame. A
+    # frame is reported once `silence` symbol periods of quiet follow it or
+    # the next marker begins. One that runs past `max_frame_seconds` is
+    # reported cut off, with "truncated" set, and the rest of it is skipped.
+    #
+    # Only the samples from the start of the current frame (or marker) are
+    # kept; signal() returns them by absolute sample index until the next
+    # feed().
+    def __init__(self, sampling_rate=EFFECTIVE_SAMPLING_RATE, window=256, silence=2.0, max_frame_seconds=None,
+                 frequency=START_MARKER_FREQUENCY, duration=START_MARKER_DURATION, min_purity=0.8, min_level=20,
+                 tones=(FREQUENCY_0, FREQUENCY_1)):
+        self.window = window
+        self.normalized_frequency = aliased_frequency(frequency, sampling_rate)
+        self.tones = None if tones is None else [aliased_frequency(tone, sampling_rate) for tone in tones]
+        self.min_purity = min_purity
+        self.min_level = min_level
+        self.min_marker_run = 0.6 * (duration * sampling_rate - window)
+        self.gap = int(silence * SYMBOL_PERIOD * sampling_rate)
+        self.min_run = int(0.5 * SYMBOL_PERIOD * sampling_rate)
+        self.max_frame = None if max_frame_seconds is None else int(max_frame_seconds * sampling_rate)
+
+        self._samples = np.zeros(1 << 16)
+        self._offset = 0    # absolute index of self._samples[0]
+        self._head = 0      # first kept sample, relative
+        self._tail = 0      # end of the received samples, relative
+        self._marker_scan = 0
+        self._marker_run = None
+        self._frame = None
+
+    @property
+    def received(self):
+        return self._offset + self._tail
+
+    @property
+    def open_frame(self):
+        # marker_start, start and end so far of the frame being assembled,
+        # the run of activity still going on included: the pauses between
+        # symbols are shorter than the window, so a frame is one long run.
+        frame = self._frame
+        if frame is None:
+            return None
+        end = self._active_end(frame)
+        return {"marker_start": frame["marker_start"], "start": frame["start"],
+                "end": frame["end"] if end is None else end}
+
+    def signal(self, start, end):
+        return self._samples[start - self._offset:end - self._offset]
+
+    def feed(self, chunk):
+        self._discard()
+        self._append(np.asarray(chunk, dtype=np.float64).ravel())
+        markers = self._scan_markers()
+        frames = self._track()
+        for marker_start, marker_end in markers:
+            if self._frame is not None:
+                frames += self._close(limit=marker_start)
+            self._open(marker_start, marker_end)
+            frames += self._track()
+        return frames
+
+    def flush(self):
+        return self._close() if self._frame is not None else []
+
+    def _append(self, chunk):
+        if self._tail + chunk.size > self._samples.size:
+            kept = self._samples[self._head:self._tail]
+            samples = np.zeros(max(2 * (kept.size + chunk.size), 1 << 16))
+            samples[:kept.size] = kept
+            self._samples = samples
+            self._offset += self._head
+            self._head, self._tail = 0, kept.size
+        self._samples[self._tail:self._tail + chunk.size] = chunk
+        self._tail += chunk.size
+
+    def _discard(self):
+        keep = self._marker_scan if self._marker_run is None else self._marker_run
+        if self._frame is not None:
+            keep = min(keep, self._frame["marker_start"])
+        self._head = max(self._head, keep - self._offset)
+
+    def _scan_markers(self):
+        count = self.received - self.window + 1 - self._marker_scan
+        if count <= 0:
+            return []
+        purity, level = tone_purity(self.signal(self._marker_scan, self.received), self.normalized_frequency,
+                                    self.window)
+        runs, self._marker_run = _extend_runs((purity >= self.min_purity) & (level >= self.min_level),
+                                              self._marker_scan, self._marker_run)
+        self._marker_scan += count
+        return [(start, end - 1 + self.window) for start, end in runs if end - start >= self.min_marker_run]
+
+    def _open(self, marker_start, marker_end):
+        self._frame = {"marker_start": marker_start, "start": marker_end, "end": marker_end,
+                       "level": 0.25 * np.sqrt(2.0) * np.std(self.signal(marker_start, marker_end)),
+                       "scan": marker_end, "run": None}
+
+    def _track(self):
+        # Extends the frame by the activity in the new samples; returns it
+        # once it is over. Goes through them a few silence gaps at a time, so
+        # a long feed (find_frames() passes the whole signal) is only looked
+        # at up to the end of the frame.
+        frame = self._frame
+        if frame is None:
+            return []
+        block = 4 * self.gap
+        while True:
+            stop = min(self.received, frame["scan"] + self.window - 1 + block)
+            count = stop - self.window + 1 - frame["scan"]
+            if count > 0:
+                samples = self.signal(frame["scan"], stop)
+                if self.tones is None:
+                    active = np.sqrt(2.0) * window_rms(samples, self.window) >= frame["level"]
+                else:
+                    active = tone_level(samples, self.tones, self.window) >= frame["level"]
+                runs, frame["run"] = _extend_runs(active, frame["scan"], frame["run"])
+                frame["scan"] += count
+                for start, end in runs:
+                    if end - start < self.min_run:
+                        # Clicks and PTT transients, not a keyed symbol.
+                        continue
+                    if start - frame["end"] > self.gap:
+                        return self._close()
+                    frame["end"] = end - 1 + self.window
+
+            run = frame["run"]
+            if (run is None or run - frame["end"] > self.gap) and frame["scan"] - 1 - frame["end"] > self.gap:
+                return self._close()
+            if self.max_frame is not None and frame["scan"] - frame["start"] > self.max_frame:
+                return self._close(truncated=True)
+            if stop == self.received:
+                return []
+
+    def _active_end(self, frame, limit=None):
+        # End of the frame if the run of activity still open continues it
+        # (and is long enough before `limit` to be a symbol), else None.
+        run = frame["run"]
+        end = frame["scan"] - 1 + self.window
+        if limit is not None:
+            end = min(end, limit)
+        if run is None or run - frame["end"] > self.gap or end - run < self.min_run:
+            return None
+        return end
+
+    def _close(self, limit=None, truncated=False):
+        # A frame still active when it has to be closed (at the next marker,
+        # the end of the stream or max_frame_seconds) is cut off there.
+        frame, self._frame = self._frame, None
+        end = self._active_end(frame, limit)
+        if end is not None:
+            truncated = True
+        else:
+            end = frame["end"] if limit is None else min(frame["end"], limit)
+        if end <= frame["start"]:
+            return []
+        return [{"marker_start": frame["marker_start"], "start": frame["start"], "end": end,
+                 "truncated": truncated}]
+
+
+def estimate_sampling_rate(signal, marker, frequency=START_MARKER_FREQUENCY):
+    # The marker tone is the only known frequency in a capture; its peak
+    # position gives the receiver's actual sample rate.
+    start, end = marker
+    segment = np.asarray(signal[start:end], dtype=np.float64)
+    segment = (segment - segment.mean()) * np.hanning(segment.size)
+    size = 1 << 16
+    spectrum = np.abs(np.fft.rfft(segment, size))
+    peak = int(np.argmax(spectrum[1:-1])) + 1
+    # Parabolic interpolation between the neighbouring bins.
+    left, centre, right = np.log(spectrum[peak - 1:peak + 2] + 1e-12)
+    offset = 0.5 * (left - right) / (left - 2 * centre + right)
+    return frequency / ((peak + offset) / size)
+
+
+def main(argv):
+    if len(argv) != 1:
+        print("Usage: python -m fskdecoder markers <capture>")
+        return 1
+
+    from .capturefile import load_samples
+
+    signal = load_samples(argv[0])
+    for frame in find_frames(signal):
+        rate = estimate_sampling_rate(signal, (frame["marker_start"], frame["start"]))
+        print(f"Frame at samples {frame['start']}..{frame['end']} "
+              f"(marker at {frame['marker_start']}, sampling rate {rate:.0f} Hz)")
@@ -0,0 +1,292 @@
+import argparse
+
+import numpy as np
+
+from .markers import MARKER_GAP, START_MARKER_DURATION, SYMBOL_PERIOD, estimate_sampling_rate, find_frames
+from .slicing import pack_bits
+from .tones import (EFFECTIVE_SAMPLING_RATE, START_MARKER_FREQUENCY, aliased_frequency, symbol_starts,
+                    symbol_windows, tone_powers)
+
+# The sender of testAudioSender.ino: one bit per SYMBOL_PERIOD.
+LEGACY_BIT_RATE = 1 / SYMBOL_PERIOD
+
+
+def gray_encode(values):
+    values = np.asarray(values)
+    return values ^ (values >> 1)
+
+
+def gray_decode(codes):
+    values = np.array(codes, copy=True)
+    shift = values >> 1
+    while np.any(shift):
+        values ^= shift
+        shift >>= 1
+    return values
+
+
+class MFSKModem:
+    # M-ary FSK with `tones` frequencies, each symbol carrying log2(tones)
+    # Gray-coded bits for `symbol_duration` seconds. A frame is the usual
+    # start marker, MARKER_GAP of silence, then the symbols back to back with
+    # continuous phase: PTT stays keyed for the whole frame, unlike sendBit(),
+    # which drops it around every bit.
+    #
+    # Tones sit `spacing` Hz apart from `base_frequency` up. The default
+    # spacing is 1.5 / symbol_duration rounded up to whole Hz (ledcWriteTone()
+    # takes integers), so tones stay separable when the receiver only uses
+    # the middle three quarters of each symbol. The receiver samples at
+    # `sampling_rate`, so every tone must alias to its own frequency there,
+    # clear of the other tones and of the start marker.
+    def __init__(self, tones=4, symbol_duration=0.05, base_frequency=400, spacing=None,
+                 sampling_rate=EFFECTIVE_SAMPLING_RATE):
+        if tones < 2 or tones & (tones - 1):
+            raise ValueError("The number of tones must be a power of two")
+        self.tones = tones
+        self.bits_per_symbol = tones.bit_length() - 1
+        self.symbol_duration = symbol_duration
+        self.sampling_rate = sampling_rate
+        if spacing is None:
+            spacing = int(np.ceil(1.5 / symbol_duration))
+        self.spacing = spacing
+        self.frequencies = [int(round(base_frequency + k * spacing)) for k in range(tones)]
+
+        # Two aliased tones closer than one bin of the demodulator window
+        # cannot be told apart.
+        aliased = np.array([aliased_frequency(f, sampling_rate) for f in self.frequencies])
+        minimum = 1.0 / self.window_length(sampling_rate)
+        gaps = np.abs(aliased[:, None] - aliased[None, :]) + np.eye(tones)
+        if gaps.min() < minimum:
+            raise ValueError(f"Tones {self.frequencies} Hz overlap when sampled at {sampling_rate:.0f} Hz")
+        if np.abs(aliased - aliased_frequency(START_MARKER_FREQUENCY, sampling_rate)).min() < minimum:
+            raise ValueError(f"Tones {self.frequencies} Hz overlap the {START_MARKER_FREQUENCY} Hz start marker")
+
+    @property
+    def bit_rate(self):
+        return self.bits_per_symbol / self.symbol_duration
+
+    def symbol_length(self, sampling_rate=None):
+        return self.symbol_duration * (sampling_rate or self.sampling_rate)
+
+    def window_length(self, sampling_rate=None):
+        # Middle three quarters of a symbol: timing errors of up to an eighth
+        # of a symbol do not leak the neighbouring symbol into the window.
+        return int(0.75 * self.symbol_length(sampling_rate))
+
+    def symbols(self, bits):
+        bits = np.asarray(bits, dtype=np.uint8)
+        padding = -bits.size % self.bits_per_symbol
+        groups = np.concatenate((bits, np.zeros(padding, np.uint8))).reshape(-1, self.bits_per_symbol)
+        values = groups.astype(np.intp) @ (1 << np.arange(self.bits_per_symbol - 1, -1, -1))
+        return gray_encode(values)
+
+    def symbol_bits(self, symbols, count=None):
+        values = gray_decode(np.asarray(symbols, dtype=np.intp))
+        shifts = np.arange(self.bits_per_symbol - 1, -1, -1)
+        bits = ((values[:, None] >> shifts) & 1).astype(np.uint8).ravel()
+        return bits if count is None else bits[:count]
+
+    def schedule(self, bits):
+        # (frequency in Hz, duration in ms) steps for a sender that keys PTT
+        # once for the frame; frequency 0 is silence.
+        steps = [(START_MARKER_FREQUENCY, int(START_MARKER_DURATION * 1000)), (0, int(MARKER_GAP * 1000))]
+        duration = self.symbol_duration * 1000
+        steps.extend((self.frequencies[symbol], duration) for symbol in self.symbols(bits))
+        return steps
+
+    def modulate(self, bits, sampling_rate=None, amplitude=1.0):
+        # One frame as received at `sampling_rate`, i.e. with every tone at
+        # its aliased frequency. Symbol boundaries fall on fractional sample
+        # positions, so long frames do not drift against the nominal rate.
+        sampling_rate = sampling_rate or self.sampling_rate
+        symbols = self.symbols(bits)
+        marker = int(round(START_MARKER_DURATION * sampling_rate))
+        gap = int(round(MARKER_GAP * sampling_rate))
+        body = int(round(symbols.size * self.symbol_length(sampling_rate)))
+
+        index = np.minimum((np.arange(body) / self.symbol_length(sampling_rate)).astype(np.intp), symbols.size - 1)
+        frequency = np.concatenate((np.full(marker, float(START_MARKER_FREQUENCY)), np.zeros(gap),
+                                    np.asarray(self.frequencies, dtype=np.float64)[symbols[index]]))
+        phase = 2 * np.pi * np.cumsum(frequency) / sampling_rate
+        signal = amplitude * np.sin(phase)
+        signal[marker:marker + gap] = 0.0
+        return signal
+
+    def _symbol_powers(self, signal, first, count, sampling_rate):
+        period = self.symbol_length(sampling_rate)
+        window = self.window_length(sampling_rate)
+        guard = (int(period) - window) // 2
+        starts = symbol_starts(first, count, period, offset=guard)
+        frequencies = [aliased_frequency(f, sampling_rate) for f in self.frequencies]
+        windows = symbol_windows(signal, starts, window)
+        powers = tone_powers(windows, frequencies)
+        # Share of the window's power in its strongest plan tone: ~1 for a
+        # clean symbol, ~0 for silence, the start marker or a window that
+        # straddles two symbols.
+        share = 2 * powers.max(axis=1, initial=0.0) / np.maximum(windows.var(axis=1), 1e-12)
+        return powers, share
+
+    def symbol_timing(self, signal, first, count, sampling_rate, steps=16, symbols=32):
+        # Tries `steps` offsets across one symbol around the nominal start and
+        # keeps the one where the strongest tone holds the largest share of
+        # the power, averaged over the first `symbols` symbols.
+        period = self.symbol_length(sampling_rate)
+        count = min(count, symbols)
+        best, best_share = first, -1.0
+        for offset in np.linspace(-0.5 * period, 0.5 * period, steps, endpoint=False):
+            start = first + offset
+            if start < 0 or start + count * period > len(signal):
+                continue
+            _, share = self._symbol_powers(signal, start, count, sampling_rate)
+            if share.mean() > best_share:
+                best, best_share = start, share.mean()
+        return best
+
+    def gap_end(self, signal, frame, sampling_rate):
+        # Where the silence after the start marker ends, i.e. where the first
+        # symbol begins. find_frames() places the end of the marker only to
+        # within its detection window, usually inside the first symbols, so
+        # look for the gap itself: of all MARKER_GAP-long stretches between
+        # the middle of the marker and two gaps past the frame start, the one
+        # with the least energy.
+        gap = int(round(MARKER_GAP * sampling_rate))
+        low = frame["marker_start"] + int(0.5 * START_MARKER_DURATION * sampling_rate)
+        high = min(len(signal), int(frame["start"]) + 2 * gap)
+        if high - low <= gap:
+            return None
+        segment = np.asarray(signal[low:high], dtype=np.float64)
+        segment = segment - segment.mean()
+        energy = np.concatenate(([0.0], np.cumsum(segment * segment)))
+        return low + int(np.argmin(energy[gap:] - energy[:-gap])) + gap
+
+    def demodulate(self, signal, frame, sampling_rate=None, bit_count=None):
+        signal = np.asarray(signal, dtype=np.float64)
+        if sampling_rate is None:
+            sampling_rate = estimate_sampling_rate(signal, (frame["marker_start"], frame["start"]))
+        period = self.symbol_length(sampling_rate)
+
+        # The timing search only looks half a symbol either way, so it needs
+        # the start of the first symbol to within that: taken from the end of
+        # the gap after the marker, or from the frame start if the gap is not
+        # found.
+        nominal = self.gap_end(signal, frame, sampling_rate)
+        if nominal is None:
+            nominal = frame["start"] + MARKER_GAP * sampling_rate
+        end = min(frame["end"], signal.size)
+        first = nominal
+        available = int((end - nominal) // period)
+        if available > 0:
+            first = self.symbol_timing(signal, nominal, available, sampling_rate)
+
+        count = max(0, int((min(end + period, signal.size) - first) // period))
+        powers, share = self._symbol_powers(signal, first, count, sampling_rate)
+        # The frame ends at the first symbol without a plan tone.
+        silent = np.flatnonzero(share < 0.3)
+        if silent.size:
+            count = int(silent[0])
+            powers = powers[:count]
+        symbols = np.argmax(powers, axis=1) if count else np.zeros(0, np.intp)
+        bits = self.symbol_bits(symbols, bit_count)
+
+        margin = None
+        if count:
+            ranked = np.sort(powers, axis=1)
+            margin = float(np.min(10 * np.log10(np.maximum(ranked[:, -1], 1e-12) /
+                                                np.maximum(ranked[:, -2], 1e-12))))
+        packed, bit_count = pack_bits(bits)
+        return {
+            "marker_start": frame["marker_start"],
+            "start": frame["start"],
+            "end": frame["end"],
+            "first_symbol": int(round(first)),
+            "sampling_rate": sampling_rate,
+            "symbol_period": period,
+            "symbol_count": count,
+            "bit_count": bit_count,
+            "bits": packed,
+            "tone_margin_db": margin,
+        }
+
+    def demodulate_capture(self, signal, sampling_rate=EFFECTIVE_SAMPLING_RATE, **kwargs):
+        # The symbols are shorter than the frame scanner's window, so frames
+        # are delimited by their RMS rather than by the level at each tone.
+        return [self.demodulate(signal, frame, **kwargs) for frame in
+                find_frames(signal, sampling_rate, tones=None)]
+
+
+def measure(modem, bit_count, snr_db, rng, frame_count=1, sampling_rate=EFFECTIVE_SAMPLING_RATE, amplitude=600.0):
+    # `frame_count` synthetic frames of `bit_count` random bits, each after a
+    # random lead-in and through its own white noise and a 12-bit ADC, as in
+    # the bundled captures. `snr_db` is the tone-to-noise power ratio over
+    # the receiver's whole band. Returns (bit errors, frames with errors,
+    # seconds on air per frame).
+    errors = bad_frames = 0
+    for _ in range(frame_count):
+        bits = rng.integers(0, 2, bit_count, dtype=np.uint8)
+        frame = modem.modulate(bits, sampling_rate, amplitude)
+        lead = rng.integers(int(0.5 * sampling_rate), int(1.0 * sampling_rate))
+        signal = np.concatenate((np.zeros(lead), frame, np.zeros(int(sampling_rate))))
+        noise = amplitude / np.sqrt(2 * 10 ** (snr_db / 10))
+        samples = np.clip(np.round(2048 + signal + rng.normal(0, noise, signal.size)), 0, 4095)
+
+        frames = find_frames(samples, sampling_rate, tones=None)
+        if frames:
+            decoded = modem.demodulate(samples, frames[0], bit_count=bit_count)
+            received = np.unpackbits(decoded["bits"], count=decoded["bit_count"])
+            frame_errors = int(np.count_nonzero(received != bits[:received.size])) + bit_count - received.size
+        else:
+            frame_errors = bit_count
+        errors += frame_errors
+        bad_frames += frame_errors > 0
+    return errors, bad_frames, frame.size / sampling_rate
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m fskdecoder modem",
+                                     description="Bit rate of M-ary FSK settings on synthetic captures.")
+    parser.add_argument("--tones", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--durations", type=float, nargs="+", default=[0.3, 0.1, 0.05, 0.03, 0.02, 0.01],
+                        help="symbol durations in seconds")
+    parser.add_argument("--snr-db", type=float, default=10.0)
+    parser.add_argument("--bits", type=int, default=1024, help="bits per frame")
+    parser.add_argument("--frames", type=int, default=4, help="frames per seed and setting")
+    parser.add_argument("--seeds", type=int, default=3, help="noise and bit patterns tried per setting")
+    parser.add_argument("--target-ber", type=float, default=1e-3)
+    parser.add_argument("--seed", type=int, default=0, help="first seed")
+    args = parser.parse_args(argv)
+
+    frame_count = args.frames * args.seeds
+    print(f"Legacy sender: {LEGACY_BIT_RATE:.2f} bit/s")
+    print(f"{frame_count} frames of {args.bits} bits per setting")
+    # bit/s is the symbol rate's; goodput (also bit/s) counts the marker
+    # and gap of every frame too.
+    print(f"{'tones':>5} {'symbol':>8} {'bit/s':>8} {'goodput':>8} {'BER':>10} {'bad frames':>11}")
+    best = None
+    for tones in args.tones:
+        for duration in args.durations:
+            try:
+                modem = MFSKModem(tones, duration)
+            except ValueError as error:
+                print(f"{tones:>5} {duration * 1000:>6.0f}ms  skipped: {error}")
+                continue
+            errors = bad_frames = 0
+            for seed in range(args.seed, args.seed + args.seeds):
+                seed_errors, seed_bad, seconds = measure(modem, args.bits, args.snr_db,
+                                                         np.random.default_rng(seed), args.frames)
+                errors += seed_errors
+                bad_frames += seed_bad
+            ber = errors / (args.bits * frame_count)
+            # Throughput including the marker and gap of one frame.
+            goodput = args.bits / seconds
+            print(f"{tones:>5} {duration * 1000:>6.0f}ms {modem.bit_rate:>8.1f} {goodput:>8.1f} {ber:>10.2e} "
+                  f"{bad_frames:>5}/{frame_count:<5}")
+            if ber <= args.target_ber and (best is None or goodput > best[0]):
+                best = (goodput, tones, duration)
+
+    if best is None:
+        print(f"No setting reached a bit error rate of {args.target_ber:g}")
+        return 1
+    goodput, tones, duration = best
+    print(f"Fastest at BER <= {args.target_ber:g}: {tones} tones, {duration * 1000:.0f} ms symbols, "
+          f"{goodput:.1f} bit/s ({goodput / LEGACY_BIT_RATE:.0f}x the legacy sender)")
+    return 0
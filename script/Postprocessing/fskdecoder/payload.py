@@ -0,0 +1,185 @@
+import numpy as np
+
+from .slicing import bits_to_string, string_to_bits
+
+# Image payload sent by testAudioSender.ino (one '0'/'1' character per bit in
+# /binary.txt). Every field is MSB first; numbers without a fixed size use
+# Elias gamma codes, so small images cost few header bits:
+#
+#   gamma(width) gamma(height) [depth - 1: 3 bits] [compression: 2 bits]
+#   gamma(payload length + 1) payload
+#
+# RAW payloads hold the pixels row by row, `depth` bits each. PLANES payloads
+# hold the bit planes from most to least significant, each as a flag bit
+# followed by the plane: 0 = width * height raw bits, 1 = run-length coded
+# (value of the first pixel, then gamma(run) for every run of equal pixels).
+# Sparse 1-bpp images shrink to a few bits per run.
+RAW = 0
+PLANES = 1
+COMPRESSION = {"none": RAW, "planes": PLANES}
+
+DEPTH_BITS = 3
+COMPRESSION_BITS = 2
+MAX_DEPTH = 1 << DEPTH_BITS
+# Larger headers are taken as corrupted rather than allocated.
+MAX_PIXELS = 1 << 24
+
+
+def gamma_encode(values):
+    # Elias gamma codes of positive integers, concatenated: n zeros, then the
+    # value in n + 1 bits, where n = floor(log2(value)).
+    values = np.asarray(values, dtype=np.int64).ravel()
+    if values.size == 0:
+        return np.zeros(0, dtype=np.uint8)
+    if values.min() < 1:
+        raise ValueError("Elias gamma codes need positive integers")
+    n = np.frexp(values.astype(np.float64))[1] - 1
+    columns = np.arange(2 * int(n.max()) + 1)
+    shifts = 2 * n[:, None] - columns
+    bits = np.where(columns < n[:, None], 0, (values[:, None] >> np.maximum(shifts, 0)) & 1)
+    return bits[columns <= 2 * n[:, None]].astype(np.uint8)
+
+
+def uint_bits(value, width):
+    return ((int(value) >> np.arange(width - 1, -1, -1)) & 1).astype(np.uint8)
+
+
+class BitReader:
+    def __init__(self, bits):
+        self.bits = np.asarray(bits, dtype=np.uint8)
+        self.position = 0
+        self._ones = np.flatnonzero(self.bits)
+
+    @property
+    def remaining(self):
+        return self.bits.size - self.position
+
+    def read(self, count):
+        if count > self.remaining:
+            raise ValueError("payload ends early")
+        chunk = self.bits[self.position:self.position + count]
+        self.position += count
+        return chunk
+
+    def uint(self, width):
+        value = 0
+        for bit in self.read(width):
+            value = (value << 1) | int(bit)
+        return value
+
+    def gamma(self):
+        index = np.searchsorted(self._ones, self.position)
+        if index == self._ones.size:
+            raise ValueError("payload ends early")
+        n = int(self._ones[index]) - self.position
+        self.position += n
+        return self.uint(n + 1)
+
+
+def run_lengths(plane):
+    # Value of the first pixel and the length of every run of equal pixels.
+    plane = np.asarray(plane, dtype=np.uint8).ravel()
+    edges = np.flatnonzero(np.diff(plane)) + 1
+    bounds = np.concatenate(([0], edges, [plane.size]))
+    return int(plane[0]), np.diff(bounds)
+
+
+def encode_plane(plane):
+    # Run-length coded unless that is longer than the plane itself.
+    plane = np.asarray(plane, dtype=np.uint8).ravel()
+    first, runs = run_lengths(plane)
+    coded = np.concatenate(([1, first], gamma_encode(runs))).astype(np.uint8)
+    if coded.size < plane.size + 1:
+        return coded
+    return np.concatenate(([0], plane)).astype(np.uint8)
+
+
+def decode_plane(reader, size):
+    if not reader.uint(1):
+        return reader.read(size).copy()
+    value = reader.uint(1)
+    runs = []
+    total = 0
+    while total < size:
+        runs.append(reader.gamma())
+        total += runs[-1]
+    if total != size:
+        raise ValueError("run lengths do not add up to the image size")
+    values = (value + np.arange(len(runs))) & 1
+    return np.repeat(values, runs).astype(np.uint8)
+
+
+def quantize_image(pixels, depth=1):
+    # 8-bit grey levels (or 0..1 floats) to `depth`-bit levels.
+    pixels = np.asarray(pixels)
+    if pixels.dtype.kind == 'f':
+        pixels = np.round(np.clip(pixels, 0.0, 1.0) * 255)
+    return (pixels.astype(np.uint16) >> (8 - depth)).astype(np.uint8)
+
+
+def encode_image(image, depth=1, compression="auto"):
+    # `image` holds levels 0 .. 2**depth - 1, shape (height, width). Returns
+    # the payload as a uint8 bit array. "auto" takes whichever of "none" and
+    # "planes" is shorter.
+    image = np.asarray(image, dtype=np.uint8)
+    if image.ndim != 2 or not image.size:
+        raise ValueError("expected a non-empty 2-D image")
+    if not 1 <= depth <= MAX_DEPTH:
+        raise ValueError(f"bit depth must be 1..{MAX_DEPTH}")
+    if image.max() >> depth:
+        raise ValueError(f"pixel levels do not fit into {depth} bits")
+
+    if compression == "auto":
+        candidates = [encode_image(image, depth, name) for name in COMPRESSION]
+        return min(candidates, key=len)
+    mode = COMPRESSION[compression]
+
+    planes = (image.ravel()[None, :] >> np.arange(depth - 1, -1, -1)[:, None]) & 1
+    if mode == RAW:
+        body = planes.T.ravel()
+    else:
+        body = np.concatenate([encode_plane(plane) for plane in planes])
+
+    height, width = image.shape
+    return np.concatenate((gamma_encode([width, height]), uint_bits(depth - 1, DEPTH_BITS),
+                           uint_bits(mode, COMPRESSION_BITS), gamma_encode([body.size + 1]),
+                           body)).astype(np.uint8)
+
+
+def decode_payload(bits, padded=False):
+    # Inverse of encode_image(): (image, depth). Raises ValueError if `bits`
+    # is not exactly one payload, e.g. a bare bitstring of the legacy sender.
+    # With `padded`, zero bits after the payload (the FEC block padding) are
+    # allowed.
+    if isinstance(bits, str):
+        bits = string_to_bits(bits)
+    reader = BitReader(bits)
+    width = reader.gamma()
+    height = reader.gamma()
+    depth = reader.uint(DEPTH_BITS) + 1
+    mode = reader.uint(COMPRESSION_BITS)
+    length = reader.gamma() - 1
+    if padded and length < reader.remaining and not reader.bits[reader.position + length:].any():
+        reader.bits = reader.bits[:reader.position + length]
+    if length != reader.remaining:
+        raise ValueError(f"payload length {length} does not match the {reader.remaining} bits received")
+
+    size = width * height
+    if size > MAX_PIXELS:
+        raise ValueError(f"{width}x{height} pixels is not a plausible image")
+    if mode == RAW:
+        planes = reader.read(size * depth).reshape(size, depth).T
+    elif mode == PLANES:
+        planes = np.stack([decode_plane(reader, size) for _ in range(depth)])
+    else:
+        raise ValueError(f"unknown compression {mode}")
+    if reader.remaining:
+        raise ValueError("bits left over after the image")
+
+    weights = (1 << np.arange(depth - 1, -1, -1)).astype(np.uint16)
+    image = (weights @ planes.astype(np.uint16)).reshape(height, width).astype(np.uint8)
+    return image, depth
+
+
+def encode_bitstring(image, depth=1, compression="auto"):
+    return bits_to_string(encode_image(image, depth, compression))
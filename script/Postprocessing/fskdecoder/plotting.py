@@ -0,0 +1,56 @@
+def plot_envelope_with_bits(smoothed_envelope, bit_positions, segment_start, segment_end):
+    import matplotlib.pyplot as plt
+
+    plt.figure(figsize=(18, 5))
+
+    plt.plot(range(segment_start, segment_end), smoothed_envelope[segment_start:segment_end],
+             color="orange", linewidth=2, linestyle="-", label="Smoothed Envelope")
+
+    for pos, amp, bit in bit_positions:
+        color = 'red' if bit == '0' else 'blue'
+        plt.scatter(pos, amp, color=color, label=f"Detected {bit}" if pos == bit_positions[0][0] else "", zorder=3)
+
+    plt.xlabel("Sample Index")
+    plt.ylabel("Amplitude")
+    plt.title("Smoothed Envelope with Detected Bits")
+    plt.legend()
+    plt.grid()
+    plt.show()
+
+
+def plot_bit_segments(segment_signal, envelope, bit_positions, segment_start, threshold):
+    import matplotlib.pyplot as plt
+
+    segment_end = segment_start + len(segment_signal)
+
+    plt.figure(figsize=(12, 5))
+    plt.plot(range(segment_start, segment_end), segment_signal, linestyle="-", markersize=2, label="Filtered Signal")
+    plt.plot(range(segment_start, segment_end), envelope, color="red", linewidth=2, label="Envelope")
+    plt.axhline(threshold, color='blue', linestyle="--", label=f"Threshold: {threshold:.2f}")  # Show threshold
+
+    for i, (start_idx, end_idx) in enumerate(bit_positions):
+        plt.axvspan(start_idx, end_idx, color="gray", alpha=0.3, label="Detected Bit Segments" if i == 0 else "")
+
+    plt.xlabel("Sample Index")
+    plt.ylabel("Amplitude")
+    plt.title("Dynamic Bit Segmentation")
+    plt.legend()
+    plt.grid()
+
+    plt.show()
+
+
+def plot_images(original, extracted, titles=("Original", "Extracted")):
+    import matplotlib.pyplot as plt
+
+    fig, axes = plt.subplots(1, 2, figsize=(8, 4))
+
+    axes[0].imshow(original, cmap='gray', vmin=0, vmax=1)
+    axes[0].set_title(titles[0])
+    axes[0].axis("off")
+
+    axes[1].imshow(extracted, cmap='gray', vmin=0, vmax=1)
+    axes[1].set_title(titles[1])
+    axes[1].axis("off")
+
+    plt.show()
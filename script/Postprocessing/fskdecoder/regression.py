@@ -0,0 +1,164 @@
+import argparse
+import glob
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from .capturefile import load_capture, read_capture_chunks
+from .envelope import compute_smoothed_envelope, extract_bits_from_envelope
+from .markers import FrameScanner, find_frames
+from .streaming import StreamingDemodulator
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUNDLED_CAPTURES = os.path.join(PACKAGE_ROOT, "serial_data_*.txt")
+
+# Importing the package or any of its modules must not change the process
+# environment: the convert scripts and `live --show` rely on matplotlib
+# picking its interactive backend afterwards.
+IMPORT_CHECK = """
+import importlib, os, pkgutil
+before = dict(os.environ)
+import fskdecoder
+for module in pkgutil.iter_modules(fskdecoder.__path__):
+    if module.name != "__main__":
+        importlib.import_module("fskdecoder." + module.name)
+print(before == dict(os.environ))
+"""
+
+
+def check_import_side_effects():
+    result = subprocess.run([sys.executable, "-c", IMPORT_CHECK], cwd=PACKAGE_ROOT,
+                            capture_output=True, text=True)
+    return result.returncode == 0 and result.stdout.strip() == "True"
+
+
+def decode_offline(signal, sampling_rate, frames, precision):
+    smoothed_envelope = compute_smoothed_envelope(signal, sampling_rate, window_size=300, precision=precision)
+    return [extract_bits_from_envelope(smoothed_envelope, frame["start"], frame["end"],
+                                       min_height=300, peak_distance=600)[0]
+            for frame in frames]
+
+
+def decode_streaming(file_path, precision):
+    demodulator = StreamingDemodulator(precision=precision)
+    for chunk in read_capture_chunks(file_path):
+        demodulator.process(chunk)
+    demodulator.flush()
+    return demodulator.bitstring
+
+
+def check_capture(file_path):
+    signal, sampling_rate = load_capture(file_path)
+    frames = find_frames(signal)
+    results = {}
+    for precision in ("float64", "float32"):
+        started = time.perf_counter()
+        offline = decode_offline(signal, sampling_rate, frames, precision)
+        streaming = decode_streaming(file_path, precision)
+        results[precision] = (offline, streaming, time.perf_counter() - started)
+    return results
+
+
+def scan_chunked(signal, chunk_size):
+    scanner = FrameScanner()
+    frames = []
+    for start in range(0, len(signal), chunk_size):
+        frames += scanner.feed(signal[start:start + chunk_size])
+    return frames + scanner.flush()
+
+
+def noisy_signals(files, noise=120.0, seed=0):
+    # (name, signal) of every capture as it is, with white noise over its
+    # whole length and only after its first frame, and of the channel
+    # simulator at the same noise: activity that does not stop between the
+    # frames, or after the last one.
+    from .capturefile import load_samples
+    from .simulate import ChannelSimulator, random_frames
+    from .tones import EFFECTIVE_SAMPLING_RATE
+
+    rng = np.random.default_rng(seed)
+    for file_path in files:
+        name = os.path.basename(file_path)
+        signal = load_samples(file_path).astype(np.float64)
+        yield name, signal
+        yield f"{name} + noise", signal + rng.normal(0, noise, signal.size)
+        frames = find_frames(signal)
+        if frames:
+            after = signal.copy()
+            after[frames[0]["end"] + 400:] += rng.normal(0, noise, after.size - frames[0]["end"] - 400)
+            yield f"{name} + noise after frame 1", after
+    simulator = ChannelSimulator(random_frames(8, 8, seed=seed), 120 * EFFECTIVE_SAMPLING_RATE, noise=noise, seed=seed)
+    yield "simulated + noise", np.concatenate(list(simulator.chunks(1 << 16))).astype(np.float64)
+
+
+def check_frames(signal, chunk_sizes=(256, 4099, 1 << 16)):
+    # find_frames() over the whole signal against FrameScanner fed in chunks:
+    # the frames and the chunk sizes that disagree.
+    frames = find_frames(signal)
+    return frames, [size for size in chunk_sizes if scan_chunked(signal, size) != frames]
+
+
+def report_imports():
+    clean = check_import_side_effects()
+    print(f"  import fskdecoder: {'environment unchanged' if clean else 'CHANGES os.environ'}")
+    return not clean
+
+
+def report_frames(files):
+    failures = 0
+    for name, signal in noisy_signals(files):
+        frames, differing = check_frames(signal)
+        failures += bool(differing)
+        truncated = sum(frame["truncated"] for frame in frames)
+        print(f"  {name}: {'match' if not differing else 'MISMATCH at chunk sizes ' + str(differing)} "
+              f"({len(frames)} frames, {truncated} truncated)")
+    return failures
+
+
+def report_precision(files):
+    mismatches = 0
+    for file_path in files:
+        results = check_capture(file_path)
+        offline_64, streaming_64, seconds_64 = results["float64"]
+        offline_32, streaming_32, seconds_32 = results["float32"]
+        same = offline_64 == offline_32 and streaming_64 == streaming_32
+        mismatches += not same
+        print(f"  {os.path.basename(file_path)}: {'match' if same else 'MISMATCH'} "
+              f"({len(offline_64)} frames, float64 {seconds_64:.2f} s, float32 {seconds_32:.2f} s)")
+        if not same:
+            print(f"    offline   float64 {offline_64}\n              float32 {offline_32}")
+            print(f"    streaming float64 {streaming_64}\n              float32 {streaming_32}")
+    return mismatches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m fskdecoder precision-check",
+                                     description="Regression checks on the bundled (or given) captures. "
+                                                 "Without a check flag, all of them run.")
+    parser.add_argument("captures", nargs="*")
+    parser.add_argument("--precision", action="store_true", help="float64 and float32 decode the same bits")
+    parser.add_argument("--frames", action="store_true",
+                        help="frames found in chunks match those of the whole signal, noisy captures included")
+    parser.add_argument("--imports", action="store_true",
+                        help="importing the package and its modules leaves os.environ unchanged")
+    args = parser.parse_args(argv)
+    everything = not (args.precision or args.frames or args.imports)
+    files = args.captures or sorted(glob.glob(BUNDLED_CAPTURES))
+
+    # Each check reports in its own section and is counted on its own.
+    checks = [("precision", "float64 vs float32 decode", lambda: report_precision(files)),
+              ("frames", "Chunked vs whole-signal frames", lambda: report_frames(files)),
+              ("imports", "Import side effects", report_imports)]
+    failed = []
+    for name, title, run in checks:
+        if everything or getattr(args, name):
+            print(f"{title}:")
+            if run():
+                failed.append(name)
+    if failed:
+        print(f"FAILED: {', '.join(failed)}")
+        return 1
+    return 0
@@ -0,0 +1,161 @@
+import argparse
+
+import numpy as np
+
+from .capturefile import DEFAULT_SAMPLE_PERIOD, CaptureWriter
+from .markers import MARKER_GAP, PAUSE_DURATION, PTT_DELAY, START_MARKER_DURATION, TONE_DURATION
+from .slicing import bits_to_string, string_to_bits
+from .tones import EFFECTIVE_SAMPLING_RATE, FREQUENCY_0, FREQUENCY_1, START_MARKER_FREQUENCY
+
+# AudioTestReceiver.ino waits SAMPLE_DELAY_US between samples; analogRead()
+# and Serial.println() take the rest of each loop (see EFFECTIVE_SAMPLING_RATE).
+LOOP_OVERHEAD = 1 / EFFECTIVE_SAMPLING_RATE - DEFAULT_SAMPLE_PERIOD
+
+# Levels of the bundled captures in ADC counts: the idle input sits at ~703
+# with ~4.7 counts of noise, and the radio passes 1800 Hz at about half the
+# amplitude of 800 Hz.
+ADC_OFFSET = 703
+ADC_MAX = 4095
+NOISE = 4.7
+TONE_AMPLITUDES = {FREQUENCY_0: 790.0, FREQUENCY_1: 415.0, START_MARKER_FREQUENCY: 555.0}
+
+
+def frame_schedule(bits, start):
+    # Segment start times (s) and tone frequencies (0 = silence) of one
+    # transmission beginning at `start`, plus the time it ends.
+    times = [start, start + START_MARKER_DURATION]
+    frequencies = [START_MARKER_FREQUENCY, 0]
+    t = times[-1] + MARKER_GAP
+    for bit in bits:
+        times += [t, t + PTT_DELAY, t + PTT_DELAY + TONE_DURATION]
+        frequencies += [0, FREQUENCY_1 if bit else FREQUENCY_0, 0]
+        t += 2 * PTT_DELAY + TONE_DURATION + PAUSE_DURATION
+    return times, frequencies, t
+
+
+class ChannelSimulator:
+    # ADC sample stream of the receiver for a series of transmissions.
+    #
+    # Each of `frames` (bit arrays, cycled as often as needed) is sent after
+    # `idle` seconds of silence, until `sample_count` samples are produced.
+    # The receiver loop takes `sample_period` + `loop_overhead` seconds per
+    # sample; every loop additionally varies by a normal `jitter` (s), and
+    # the variations add up, so the sample clock wanders as on the real
+    # board. The received level is scaled by 1 + gain_drift * sin(2 pi t /
+    # drift_period), Gaussian `noise` (counts) is added, and the result is
+    # rounded and clipped to the 12-bit ADC range.
+    #
+    # Samples are produced chunk by chunk, so arbitrarily long captures need
+    # memory for one chunk only. `spans` lists (first sample, end sample,
+    # bits) of every transmission completed so far.
+    def __init__(self, frames, sample_count, idle=1.0, noise=NOISE, gain_drift=0.0, drift_period=600.0,
+                 jitter=0.0, sample_period=DEFAULT_SAMPLE_PERIOD, loop_overhead=LOOP_OVERHEAD, seed=0):
+        self.frames = [np.asarray(bits, dtype=np.uint8) for bits in frames]
+        self.sample_count = int(sample_count)
+        self.idle = idle
+        self.noise = noise
+        self.gain_drift = gain_drift
+        self.drift_period = drift_period
+        self.jitter = jitter
+        self.sample_period = sample_period
+        self.interval = sample_period + loop_overhead
+        self.rng = np.random.default_rng(seed)
+        self.spans = []
+
+        # Enough transmissions to cover the capture even with a slow clock.
+        duration = 1.1 * self.sample_count * self.interval + 10 * self.jitter * np.sqrt(self.sample_count)
+        times, frequencies, frame_times = [], [], []
+        t = 0.0
+        while t < duration:
+            bits = self.frames[len(frame_times) % len(self.frames)]
+            segment_times, segment_frequencies, end = frame_schedule(bits, t + idle)
+            frame_times.append((segment_times[0], end, bits))
+            times += segment_times
+            frequencies += segment_frequencies
+            t = end
+        times.append(t)
+        frequencies.append(0)
+        self._times = np.asarray(times)
+        self._frequencies = np.asarray(frequencies, dtype=np.float64)
+        self._amplitudes = np.array([TONE_AMPLITUDES.get(f, 0.0) for f in frequencies])
+        self._frame_times = frame_times
+
+    @property
+    def sampling_rate(self):
+        return 1 / self.interval
+
+    def chunks(self, chunk_size=1 << 16):
+        produced = 0
+        clock = 0.0
+        next_start = next_end = 0
+        self._firsts = []
+        while produced < self.sample_count:
+            size = min(chunk_size, self.sample_count - produced)
+            steps = np.full(size, self.interval)
+            if self.jitter:
+                steps += self.rng.normal(0.0, self.jitter, size)
+            instants = clock + np.cumsum(steps) - steps[0]
+            clock = instants[-1] + steps[-1] if size else clock
+
+            segment = np.searchsorted(self._times, instants, side='right') - 1
+            elapsed = instants - self._times[segment]
+            level = self._amplitudes[segment] * np.sin(2 * np.pi * self._frequencies[segment] * elapsed)
+            if self.gain_drift:
+                level *= 1 + self.gain_drift * np.sin(2 * np.pi * instants / self.drift_period)
+            if self.noise:
+                level += self.rng.normal(0.0, self.noise, size)
+            samples = np.clip(np.round(ADC_OFFSET + level), 0, ADC_MAX).astype(np.uint16)
+
+            # Sample index of every frame start and end inside this chunk.
+            while next_start < len(self._frame_times) and self._frame_times[next_start][0] <= instants[-1]:
+                first = produced + np.searchsorted(instants, self._frame_times[next_start][0])
+                self._firsts.append(int(first))
+                next_start += 1
+            while next_end < next_start and self._frame_times[next_end][1] <= instants[-1]:
+                last = produced + np.searchsorted(instants, self._frame_times[next_end][1])
+                self.spans.append((self._firsts[next_end], int(last), self._frame_times[next_end][2]))
+                next_end += 1
+
+            produced += size
+            yield samples
+
+    def write(self, file_path, chunk_size=1 << 16):
+        # The header carries the nominal period, as scanSerialPort.py writes it.
+        with CaptureWriter(file_path, sample_period=self.sample_period, port="simulated",
+                           start_time=0.0) as writer:
+            for samples in self.chunks(chunk_size):
+                writer.write(samples)
+        return writer.sample_count
+
+
+def random_frames(count, bit_count, seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 2, bit_count, dtype=np.uint8) for _ in range(count)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m fskdecoder simulate",
+                                     description="Write a synthetic binary capture of the legacy sender.")
+    parser.add_argument("output")
+    parser.add_argument("--samples", type=float, default=1e5)
+    parser.add_argument("--bits", default=None, help="bitstring to send; random 8-bit frames if omitted")
+    parser.add_argument("--idle", type=float, default=1.0, help="silence before every frame [s]")
+    parser.add_argument("--noise", type=float, default=NOISE, help="noise standard deviation [ADC counts]")
+    parser.add_argument("--gain-drift", type=float, default=0.0, help="relative depth of the gain drift")
+    parser.add_argument("--drift-period", type=float, default=600.0, help="period of the gain drift [s]")
+    parser.add_argument("--jitter", type=float, default=0.0, help="per-sample loop time jitter [s]")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.bits:
+        frames = [string_to_bits(args.bits)]
+    else:
+        frames = random_frames(64, 8, args.seed)
+    simulator = ChannelSimulator(frames, args.samples, idle=args.idle, noise=args.noise,
+                                 gain_drift=args.gain_drift, drift_period=args.drift_period,
+                                 jitter=args.jitter, seed=args.seed)
+    count = simulator.write(args.output)
+    print(f"Wrote {count} samples ({len(simulator.spans)} frames) to {args.output}")
+    for first, last, bits in simulator.spans[:10]:
+        print(f"  samples {first}..{last}: {bits_to_string(bits)}")
+    return 0
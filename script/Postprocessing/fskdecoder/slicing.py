@@ -0,0 +1,93 @@
+import numpy as np
+
+
+def cumulative_sum(envelope):
+    # Running sum with a leading zero, so the sum of any stretch of the
+    # envelope is the difference of two entries.
+    return np.concatenate(([0.0], np.cumsum(np.asarray(envelope, dtype=np.float64))))
+
+
+def window_sums(cumulative, starts, length):
+    # Sums of the `length` samples from every start, from cumulative_sum().
+    starts = np.asarray(starts, dtype=np.intp)
+    return cumulative[starts + length] - cumulative[starts]
+
+
+def segment_means(envelope, boundaries):
+    # Mean of envelope[boundaries[i]:boundaries[i + 1]] for every i, in one pass.
+    boundaries = np.asarray(boundaries, dtype=np.intp)
+    if boundaries.size < 2:
+        return np.zeros(0)
+    lengths = np.diff(boundaries)
+    if np.any(lengths <= 0):
+        raise ValueError("Segment boundaries must be strictly increasing")
+    cumulative = cumulative_sum(envelope)
+    return (cumulative[boundaries[1:]] - cumulative[boundaries[:-1]]) / lengths
+
+
+def threshold_bits(amplitudes, threshold):
+    # The 800 Hz tone ('0') comes through louder than the 1800 Hz tone ('1').
+    return (np.asarray(amplitudes) <= threshold).astype(np.uint8)
+
+
+def two_cluster_threshold(amplitudes):
+    # Otsu split of a 1-D sample: the cut that minimises the summed squared
+    # deviation of the two resulting groups, evaluated for all cuts at once.
+    values = np.sort(np.asarray(amplitudes, dtype=np.float64))
+    if values.size < 2:
+        return values[0] if values.size else 0.0
+    counts = np.arange(1, values.size)
+    cumulative = np.cumsum(values)[:-1]
+    cumulative_sq = np.cumsum(values * values)[:-1]
+    total, total_sq = cumulative[-1] + values[-1], cumulative_sq[-1] + values[-1] ** 2
+    upper_counts = values.size - counts
+    lower_cost = cumulative_sq - cumulative * cumulative / counts
+    upper_cost = (total_sq - cumulative_sq) - (total - cumulative) ** 2 / upper_counts
+    cut = np.argmin(lower_cost + upper_cost)
+    return 0.5 * (values[cut] + values[cut + 1])
+
+
+def band_bits(amplitudes, one_band=(370, 420), zero_band=(750, 800)):
+    amplitudes = np.asarray(amplitudes)
+    is_one = (amplitudes >= one_band[0]) & (amplitudes <= one_band[1])
+    is_zero = (amplitudes >= zero_band[0]) & (amplitudes <= zero_band[1])
+    valid = is_one | is_zero
+    return is_one[valid].astype(np.uint8), valid
+
+
+def pack_bits(bits):
+    bits = np.asarray(bits, dtype=np.uint8)
+    return np.packbits(bits), bits.size
+
+
+def unpack_bits(packed, count):
+    return np.unpackbits(np.asarray(packed, dtype=np.uint8), count=count)
+
+
+def bits_to_string(bits):
+    bits = np.asarray(bits, dtype=np.uint8)
+    return (bits + ord('0')).tobytes().decode('ascii')
+
+
+def string_to_bits(bitstring):
+    return np.frombuffer(bitstring.encode('ascii'), dtype=np.uint8) - ord('0')
+
+
+def count_bit_errors(bits, reference):
+    if reference is None:
+        return None
+    common = min(bits.size, reference.size)
+    errors = int(np.count_nonzero(bits[:common] != reference[:common]))
+    return errors + abs(bits.size - reference.size)
+
+
+def slice_segments(envelope, boundaries, threshold):
+    amplitudes = segment_means(envelope, boundaries)
+    return pack_bits(threshold_bits(amplitudes, threshold)), amplitudes
+
+
+def slice_peaks(envelope, peaks, one_band=(370, 420), zero_band=(750, 800)):
+    peaks = np.asarray(peaks, dtype=np.intp)
+    amplitudes = np.asarray(envelope)[peaks]
+    bits, valid = band_bits(amplitudes, one_band, zero_band)
+    return pack_bits(bits), peaks[valid], amplitudes[valid]
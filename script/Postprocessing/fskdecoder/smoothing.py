@@ -0,0 +1,58 @@
+import numpy as np
+
+from .filters import real_dtype
+
+
+def _window_split(window):
+    # np.convolve(x, np.ones(W) / W, mode='same') centres the window so that
+    # output n averages x[n - lead .. n + lag].
+    lag = (window - 1) // 2
+    return window - 1 - lag, lag
+
+
+def moving_average(x, window):
+    # O(N) replacement for np.convolve(x, np.ones(window) / window, mode='same'),
+    # including its zero padding at both ends. float32 input stays float32;
+    # only the running sum is accumulated in float64.
+    x = np.asarray(x)
+    if x.size < window:
+        # mode='same' returns max(len(x), window) samples in this case.
+        return np.convolve(x, np.ones(window) / window, mode='same')
+    lead, lag = _window_split(window)
+    dtype = np.result_type(x.dtype, np.float32)
+    padded = np.concatenate((np.zeros(lead, dtype), x.astype(dtype, copy=False), np.zeros(lag, dtype)))
+    cumulative = np.concatenate((np.zeros(1, np.float64), np.cumsum(padded, dtype=np.float64)))
+    return ((cumulative[window:] - cumulative[:-window]) / window).astype(dtype, copy=False)
+
+
+class StreamingMovingAverage:
+    # Chunked moving_average(). The last window - 1 inputs are carried over so
+    # each window sum spans chunk boundaries. Output lags the input by
+    # (window - 1) // 2 samples; flush() returns the rest once the stream ends.
+    def __init__(self, window, precision='float64'):
+        self.window = window
+        self.dtype = real_dtype(precision)
+        self.lead, self.lag = _window_split(window)
+        self._tail = np.zeros(self.lead, self.dtype)
+        self.samples_in = 0
+        self.samples_out = 0
+
+    def process(self, chunk):
+        chunk = np.asarray(chunk, dtype=self.dtype)
+        self.samples_in += chunk.size
+        return self._emit(chunk)
+
+    def flush(self):
+        return self._emit(np.zeros(self.lag))
+
+    def _emit(self, chunk):
+        padded = np.concatenate((self._tail, chunk))
+        if padded.size < self.window:
+            self._tail = padded
+            return np.zeros(0, self.dtype)
+        cumulative = np.concatenate(([0.0], np.cumsum(padded, dtype=np.float64)))
+        out = ((cumulative[self.window:] - cumulative[:-self.window]) / self.window).astype(self.dtype)
+        self._tail = padded[padded.size - (self.window - 1):]
+        out = out[:self.samples_in - self.samples_out]
+        self.samples_out += out.size
+        return out
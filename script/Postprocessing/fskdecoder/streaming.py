@@ -0,0 +1,112 @@
+import numpy as np
+from scipy.signal import find_peaks
+
+from .capturefile import read_capture_chunks
+from .envelope import StreamingEnvelope
+from .filters import StreamingFilter
+from .smoothing import StreamingMovingAverage
+from .slicing import bits_to_string, slice_peaks, unpack_bits
+
+SAMPLING_RATE = 1 / (277e-6)
+
+
+class StreamingDemodulator:
+    def __init__(self, sampling_rate=SAMPLING_RATE, cutoff=700, order=5, window_size=300,
+                 block_size=4096, overlap=512, min_height=300, peak_distance=600,
+                 one_band=(370, 420), zero_band=(750, 800), precision='float64'):
+        self.highpass = StreamingFilter(cutoff, sampling_rate, order, precision=precision)
+
+        self.block_size = block_size
+        self.overlap = overlap
+        self.window_size = window_size
+        self.min_height = min_height
+        self.peak_distance = peak_distance
+        self.one_band = one_band
+        self.zero_band = zero_band
+
+        self.envelope = StreamingEnvelope(block_size, overlap, precision)
+        self.smoother = StreamingMovingAverage(window_size, precision)
+
+        # Smoothed envelope kept for peak search, starting at _peak_base.
+        self._smoothed = np.zeros(0, self.highpass.dtype)
+        self._peak_base = 0
+        self._last_peak = -peak_distance - 1
+
+        self.bit_positions = []
+        self.samples_seen = 0
+
+    @property
+    def bitstring(self):
+        return "".join(bit for _, _, bit in self.bit_positions)
+
+    @property
+    def latency(self):
+        # Worst case number of samples between a peak and its bit being emitted.
+        return self.block_size + self.overlap + (self.window_size - 1) // 2 + 2 * self.peak_distance
+
+    def process(self, chunk):
+        chunk = np.asarray(chunk, dtype=self.highpass.dtype)
+        if chunk.size == 0:
+            return []
+        filtered = self.highpass.process(chunk)
+        self.samples_seen += chunk.size
+
+        envelope = self.envelope.process(filtered)
+        smoothed = self.smoother.process(envelope)
+        return self._detect_bits(smoothed)
+
+    def flush(self):
+        envelope = self.envelope.flush()
+        smoothed = np.concatenate((self.smoother.process(envelope), self.smoother.flush()))
+        return self._detect_bits(smoothed, final=True)
+
+    def _detect_bits(self, smoothed, final=False):
+        self._smoothed = np.concatenate((self._smoothed, smoothed))
+        lookahead = 0 if final else 2 * self.peak_distance
+        commit_end = self._peak_base + self._smoothed.size - lookahead
+        if commit_end <= self._peak_base:
+            return []
+
+        peaks, _ = find_peaks(self._smoothed, height=self.min_height, distance=self.peak_distance)
+        positions = self._peak_base + peaks
+        candidates = []
+        for peak, position in zip(peaks, positions):
+            if position >= commit_end:
+                break
+            if position - self._last_peak < self.peak_distance:
+                continue
+            self._last_peak = position
+            candidates.append(peak)
+
+        (packed, count), kept, amplitudes = slice_peaks(self._smoothed, candidates,
+                                                        self.one_band, self.zero_band)
+        bits = bits_to_string(unpack_bits(packed, count))
+        new_bits = list(zip((self._peak_base + kept).tolist(), amplitudes.tolist(), bits))
+
+        # Keep enough history for find_peaks to see the same neighbourhood
+        # again when the next chunk arrives.
+        keep_from = max(0, commit_end - 2 * self.peak_distance - self._peak_base)
+        self._smoothed = self._smoothed[keep_from:]
+        self._peak_base += keep_from
+
+        self.bit_positions.extend(new_bits)
+        return new_bits
+
+
+def decode_capture(file_path, follow=False, **kwargs):
+    demodulator = StreamingDemodulator(**kwargs)
+    try:
+        for chunk in read_capture_chunks(file_path, follow=follow):
+            for position, amplitude, bit in demodulator.process(chunk):
+                print(f"Bit {bit} at sample {position} (amplitude {amplitude:.0f})")
+    except KeyboardInterrupt:
+        print("Stopping capture decode.")
+    demodulator.flush()
+    return demodulator.bitstring
+
+
+def main(argv):
+    file_path = argv[0] if argv else "serial_data.txt"
+    follow = "--follow" in argv[1:]
+    bitstring = decode_capture(file_path, follow=follow)
+    print(f"Extrahierter Bitstring: {bitstring}")
@@ -0,0 +1,245 @@
+import argparse
+
+import numpy as np
+
+from .payload import (DEPTH_BITS, MAX_DEPTH, MAX_PIXELS, BitReader, decode_plane, encode_plane, gamma_encode,
+                      uint_bits)
+from .slicing import bits_to_string, string_to_bits
+
+# Tiled payload: the image is cut into tile x tile blocks, and every bit
+# plane of every block is sent as its own unit with a CRC, so whatever
+# arrives intact can be shown right away and a broken or missing unit costs
+# only its own block. Bit planes go out from most to least significant over
+# the whole image, so a grey image first appears coarse and then sharpens.
+#
+#   header: gamma(width) gamma(height) [depth - 1: 3 bits] gamma(tile)
+#           [compressed: 1 bit] CRC-8
+#   unit:   the tile's bits of the plane, row by row, CRC-8
+#           compressed: gamma(length + 1) plane (payload.encode_plane) CRC-8
+#
+# Uncompressed units, the default, sit at fixed positions, so a wrong bit
+# only ever costs its own unit. A compressed unit with a bad CRC is skipped
+# by its length (the CRC covers it too); if the length itself was hit, the
+# units after it are lost as well, so compression is only worth it on a
+# clean channel.
+CRC_BITS = 8
+CRC_POLYNOMIAL = 0x07
+
+_CRC_TABLE = np.zeros(256, dtype=np.uint8)
+for _byte in range(256):
+    _crc = _byte
+    for _ in range(8):
+        _crc = ((_crc << 1) ^ CRC_POLYNOMIAL if _crc & 0x80 else _crc << 1) & 0xFF
+    _CRC_TABLE[_byte] = _crc
+
+
+def crc8(bits):
+    # CRC-8 (polynomial 0x07, MSB first) of a bit array of any length: whole
+    # bytes through the table, the remaining bits one at a time.
+    bits = np.asarray(bits, dtype=np.uint8)
+    whole = bits.size - bits.size % 8
+    crc = 0
+    for byte in np.packbits(bits[:whole]).tolist():
+        crc = int(_CRC_TABLE[crc ^ byte])
+    for bit in bits[whole:].tolist():
+        crc = ((crc << 1) ^ CRC_POLYNOMIAL if (crc >> 7) ^ bit else crc << 1) & 0xFF
+    return crc
+
+
+def with_crc(bits):
+    return np.concatenate((bits, uint_bits(crc8(bits), CRC_BITS))).astype(np.uint8)
+
+
+def tile_grid(height, width, tile):
+    # (row slice, column slice) of every tile, row by row.
+    return [(slice(top, min(top + tile, height)), slice(left, min(left + tile, width)))
+            for top in range(0, height, tile) for left in range(0, width, tile)]
+
+
+def encode_tiles(image, depth=1, tile=8, compressed=False):
+    image = np.asarray(image, dtype=np.uint8)
+    if image.ndim != 2 or not image.size:
+        raise ValueError("expected a non-empty 2-D image")
+    if not 1 <= depth <= MAX_DEPTH:
+        raise ValueError(f"bit depth must be 1..{MAX_DEPTH}")
+    if image.max() >> depth:
+        raise ValueError(f"pixel levels do not fit into {depth} bits")
+
+    height, width = image.shape
+    parts = [with_crc(np.concatenate((gamma_encode([width, height]), uint_bits(depth - 1, DEPTH_BITS),
+                                      gamma_encode([tile]), [int(compressed)])))]
+    for plane in range(depth - 1, -1, -1):
+        bits = (image >> plane) & 1
+        for rows, columns in tile_grid(height, width, tile):
+            if compressed:
+                body = encode_plane(bits[rows, columns])
+                parts.append(with_crc(np.concatenate((gamma_encode([body.size + 1]), body))))
+            else:
+                parts.append(with_crc(bits[rows, columns].ravel()))
+    return np.concatenate(parts)
+
+
+class TileReconstructor:
+    # Rebuilds a tiled payload from bits fed in any pieces. `image` holds the
+    # pixel levels and is updated in place as units are checked; `received`
+    # (planes x tiles, most significant plane first) tells which units made
+    # it. Before a tile's lower planes arrive, preview() shows it at the
+    # middle of the levels its known planes allow.
+    def __init__(self):
+        self.image = None
+        self.width = self.height = self.depth = self.tile = self.compressed = None
+        self.received = None
+        self.failed = 0
+        self._bits = np.zeros(0, dtype=np.uint8)
+        self._unit = 0
+        self._known_planes = None
+
+    @property
+    def unit_count(self):
+        return 0 if self.received is None else self.received.size
+
+    @property
+    def complete(self):
+        return self.received is not None and bool(self.received.all())
+
+    @property
+    def finished(self):
+        return self.received is not None and self._unit >= self.unit_count
+
+    def feed(self, bits):
+        # Returns (plane, tile index, ok) of every unit completed by `bits`.
+        if isinstance(bits, str):
+            bits = string_to_bits(bits)
+        self._bits = np.concatenate((self._bits, np.asarray(bits, dtype=np.uint8)))
+        updates = []
+        reader = BitReader(self._bits)
+        while not self.finished:
+            start = reader.position
+            try:
+                if self.image is None:
+                    self._read_header(reader)
+                else:
+                    updates.append(self._read_unit(reader, start))
+            except EOFError:
+                reader.position = start
+                break
+        self._bits = self._bits[reader.position:]
+        return updates
+
+    def _checked(self, reader, start):
+        # Reads the CRC after the field that began at `start`.
+        if reader.remaining < CRC_BITS:
+            raise EOFError
+        covered = reader.bits[start:reader.position]
+        return reader.uint(CRC_BITS) == crc8(covered)
+
+    def _read_header(self, reader):
+        try:
+            width, height = reader.gamma(), reader.gamma()
+            depth = reader.uint(DEPTH_BITS) + 1
+            tile = reader.gamma()
+            compressed = bool(reader.uint(1))
+        except ValueError:
+            raise EOFError
+        if not self._checked(reader, 0):
+            raise ValueError("tiled payload header is corrupted")
+        if width * height > MAX_PIXELS:
+            raise ValueError(f"{width}x{height} pixels is not a plausible image")
+        self.width, self.height, self.depth, self.tile = width, height, depth, tile
+        self.compressed = compressed
+        self.image = np.zeros((height, width), dtype=np.uint8)
+        self._grid = tile_grid(height, width, tile)
+        self.received = np.zeros((depth, len(self._grid)), dtype=bool)
+        self._known_planes = np.zeros(len(self._grid), dtype=np.int64)
+
+    def _read_unit(self, reader, start):
+        plane, index = divmod(self._unit, len(self._grid))
+        rows, columns = self._grid[index]
+        shape = (rows.stop - rows.start, columns.stop - columns.start)
+        if self.compressed:
+            try:
+                length = reader.gamma() - 1
+            except ValueError:
+                raise EOFError
+        else:
+            length = shape[0] * shape[1]
+        start_body = reader.position
+        if reader.remaining < length + CRC_BITS:
+            raise EOFError
+        reader.position += length
+        ok = self._checked(reader, start)
+
+        self._unit += 1
+        if ok:
+            body = BitReader(reader.bits[start_body:start_body + length])
+            try:
+                if self.compressed:
+                    bits = decode_plane(body, shape[0] * shape[1]).reshape(shape)
+                else:
+                    bits = body.read(length).reshape(shape)
+                ok = not body.remaining
+            except ValueError:
+                ok = False
+            if ok:
+                self.image[rows, columns] |= bits << (self.depth - 1 - plane)
+                self.received[plane, index] = True
+                self._known_planes[index] = max(self._known_planes[index], plane + 1)
+        if not ok:
+            self.failed += 1
+        return plane, index, ok
+
+    def preview(self):
+        # Levels scaled to 0..1; tiles without any plane stay black.
+        if self.image is None:
+            return None
+        preview = self.image.astype(np.float64)
+        for index, known in enumerate(self._known_planes):
+            if 0 < known < self.depth:
+                rows, columns = self._grid[index]
+                preview[rows, columns] += (1 << (self.depth - known)) / 2 - 0.5
+        return preview / ((1 << self.depth) - 1)
+
+
+def decode_tiles(bits):
+    # (reconstructor, fraction of units received) of a complete bitstring.
+    reconstructor = TileReconstructor()
+    reconstructor.feed(bits)
+    if reconstructor.image is None:
+        raise ValueError("no tiled payload header")
+    return reconstructor, reconstructor.received.mean()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m fskdecoder tiles",
+                                     description="Rebuild a tiled payload piece by piece, as a receiver would.")
+    parser.add_argument("bitfile", help="'0'/'1' file written by encodeImage.py --tile")
+    parser.add_argument("--step", type=int, default=64, help="bits fed per step")
+    parser.add_argument("--errors", type=int, default=0, help="flip this many random bits first")
+    parser.add_argument("--cut", type=float, default=1.0, help="fraction of the bits that arrive")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    with open(args.bitfile) as f:
+        bits = string_to_bits(f.read().strip())
+    rng = np.random.default_rng(args.seed)
+    bits = bits[:int(args.cut * bits.size)].copy()
+    if args.errors:
+        bits[rng.choice(bits.size, args.errors, replace=False)] ^= 1
+
+    reconstructor = TileReconstructor()
+    for start in range(0, bits.size, args.step):
+        updates = reconstructor.feed(bits[start:start + args.step])
+        if updates:
+            good = sum(ok for _, _, ok in updates)
+            print(f"after {min(start + args.step, bits.size):6d} bits: {good}/{len(updates)} units ok, "
+                  f"{100 * reconstructor.received.mean():5.1f}% of the image")
+    if reconstructor.image is None:
+        print("The header did not arrive intact.")
+        return 1
+    print(f"{reconstructor.width}x{reconstructor.height}, {reconstructor.depth} bpp, "
+          f"{reconstructor.tile}-pixel tiles: {int(reconstructor.received.sum())}/{reconstructor.unit_count} "
+          f"units, {reconstructor.failed} failed CRC")
+    if reconstructor.width <= 64:
+        for row in reconstructor.preview():
+            print(bits_to_string((row >= 0.5).astype(np.uint8)).replace('0', '.').replace('1', '#'))
+    return 0
@@ -0,0 +1,114 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from .slicing import bits_to_string, pack_bits, two_cluster_threshold, unpack_bits
+
+# Tone plan of AudioTestSender/testAudioSender.ino.
+FREQUENCY_0 = 800
+FREQUENCY_1 = 1800
+START_MARKER_FREQUENCY = 1200
+
+# AudioTestReceiver.ino waits SAMPLE_DELAY_US = 277 between samples, but
+# analogRead() and Serial.println() add to that: the 1200 Hz start marker
+# in the bundled captures puts the real loop rate at about 2595 Hz. At that
+# rate 800 Hz and 1800 Hz alias to within 5 Hz of each other, so a symbol
+# window must span well over 500 samples to tell them apart.
+EFFECTIVE_SAMPLING_RATE = 2595.0
+
+
+def aliased_frequency(frequency, sampling_rate):
+    # Normalized frequency (cycles per sample, 0..0.5) at which a tone shows up.
+    normalized = (frequency / sampling_rate) % 1.0
+    return min(normalized, 1.0 - normalized)
+
+
+def symbol_windows(signal, starts, length):
+    signal = np.asarray(signal, dtype=np.float64)
+    starts = np.asarray(starts, dtype=np.intp)
+    if starts.size and (starts.min() < 0 or starts.max() + length > signal.size):
+        raise ValueError("Symbol windows run past the end of the signal")
+    return sliding_window_view(signal, length)[starts]
+
+
+def goertzel_power(windows, normalized_frequency):
+    # One Goertzel filter per row; the recurrence runs over the samples while
+    # every row (symbol window) is updated in the same array operation.
+    windows = np.asarray(windows, dtype=np.float64)
+    windows = windows - windows.mean(axis=1, keepdims=True)
+    length = windows.shape[1]
+    coeff = 2.0 * np.cos(2.0 * np.pi * normalized_frequency)
+
+    s1 = np.zeros(windows.shape[0])
+    s2 = np.zeros(windows.shape[0])
+    for k in range(length):
+        s0 = windows[:, k] + coeff * s1 - s2
+        s2 = s1
+        s1 = s0
+
+    power = s1 * s1 + s2 * s2 - coeff * s1 * s2
+    return power / (length * length)
+
+
+def tone_powers(windows, normalized_frequencies):
+    # Single-bin DFT power of every window at every frequency, as one matrix
+    # product; scaled like goertzel_power(). Returns (windows, frequencies).
+    windows = np.asarray(windows, dtype=np.float64)
+    windows = windows - windows.mean(axis=1, keepdims=True)
+    length = windows.shape[1]
+    phase = np.outer(np.arange(length), np.asarray(normalized_frequencies, dtype=np.float64))
+    spectrum = windows @ np.exp(-2j * np.pi * phase)
+    return (spectrum.real ** 2 + spectrum.imag ** 2) / (length * length)
+
+
+class ToneDetector:
+    def __init__(self, sampling_rate=EFFECTIVE_SAMPLING_RATE, frequency_0=FREQUENCY_0,
+                 frequency_1=FREQUENCY_1, symbol_length=700):
+        self.sampling_rate = sampling_rate
+        self.symbol_length = symbol_length
+        self.frequency_0 = aliased_frequency(frequency_0, sampling_rate)
+        self.frequency_1 = aliased_frequency(frequency_1, sampling_rate)
+
+    @property
+    def resolvable(self):
+        # The two tones need to be at least one DFT bin apart within a window.
+        return abs(self.frequency_0 - self.frequency_1) * self.symbol_length >= 1.0
+
+    def powers(self, windows):
+        power_0 = goertzel_power(windows, self.frequency_0)
+        if not self.resolvable:
+            return power_0, power_0
+        return power_0, goertzel_power(windows, self.frequency_1)
+
+    def detect(self, signal, starts):
+        windows = symbol_windows(signal, starts, self.symbol_length)
+        power_0, power_1 = self.powers(windows)
+
+        if self.resolvable:
+            bits = (power_1 > power_0).astype(np.uint8)
+        else:
+            # Both tones land in the same bin, so only their level differs:
+            # the radio passes 1800 Hz at roughly half the amplitude of 800 Hz.
+            # Splitting at the gap between the two clusters keeps this
+            # independent of the receiver volume.
+            amplitude = np.sqrt(power_0)
+            bits = (amplitude < two_cluster_threshold(amplitude)).astype(np.uint8)
+
+        return pack_bits(bits), power_0, power_1
+
+
+def symbol_starts(first_start, count, period, offset=0):
+    return np.round(first_start + offset + np.arange(count) * period).astype(np.intp)
+
+
+def main(argv):
+    if len(argv) != 4:
+        print("Usage: python -m fskdecoder tones <capture> <first symbol sample> <symbol count> <symbol period>")
+        return 1
+
+    from .capturefile import load_samples
+
+    signal = load_samples(argv[0])
+    detector = ToneDetector()
+    starts = symbol_starts(int(argv[1]), int(argv[2]), float(argv[3]))
+    (packed, count), _, _ = detector.detect(signal, starts)
+    print(f"Extrahierter Bitstring: {bits_to_string(unpack_bits(packed, count))}")
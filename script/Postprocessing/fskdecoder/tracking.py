@@ -0,0 +1,225 @@
+import numpy as np
+
+from .slicing import cumulative_sum, threshold_bits, two_cluster_threshold, window_sums
+
+
+class AdaptiveThreshold:
+    # Two-cluster (k-means) slicer that keeps learning while it decodes. The
+    # loud ('0', 800 Hz) and quiet ('1', 1800 Hz) levels are each tracked as an
+    # exponential mean over roughly the last `memory` symbols of that class.
+    # Gain drift moves both levels together, so whenever one of them is
+    # updated the other is rescaled by the same factor; a long run of equal
+    # bits then does not leave the absent level behind.
+    #
+    # Until the levels are known, amplitudes are held back. After `warmup`
+    # symbols an Otsu split seeds the two levels, provided the groups differ
+    # by at least `min_contrast`. `levels=(zero_level, one_level)` skips the
+    # warm-up.
+    def __init__(self, memory=16, warmup=4, min_contrast=1.25, levels=None):
+        self.rate = 1.0 / memory
+        self.warmup = warmup
+        self.min_contrast = min_contrast
+        self.levels = None if levels is None else [float(levels[0]), float(levels[1])]
+        self._pending = []
+
+    @property
+    def threshold(self):
+        return None if self.levels is None else 0.5 * (self.levels[0] + self.levels[1])
+
+    def update(self, amplitude):
+        # Returns the bits that are decided now: the one for `amplitude`, or
+        # none (still warming up), or all the held-back ones at once.
+        if self.levels is None:
+            self._pending.append(float(amplitude))
+            if len(self._pending) < self.warmup or not self._seed(self._pending):
+                return []
+            return self._release()
+        return [self._slice(float(amplitude))]
+
+    def flush(self):
+        # Decides the held-back amplitudes with whatever was seen. Without any
+        # contrast one level cannot be told from the other; such a run is
+        # reported as zeros.
+        if not self._pending:
+            return []
+        if self.levels is None and not self._seed(self._pending):
+            bits = [0] * len(self._pending)
+            self._pending = []
+            return bits
+        return self._release()
+
+    def _seed(self, amplitudes):
+        amplitudes = np.asarray(amplitudes)
+        threshold = two_cluster_threshold(amplitudes)
+        lower = amplitudes[amplitudes <= threshold]
+        upper = amplitudes[amplitudes > threshold]
+        if lower.size == 0 or upper.size == 0 or upper.mean() < self.min_contrast * lower.mean():
+            return False
+        self.levels = [float(upper.mean()), float(lower.mean())]
+        return True
+
+    def _release(self):
+        pending, self._pending = self._pending, []
+        return [self._slice(amplitude) for amplitude in pending]
+
+    def _slice(self, amplitude):
+        bit = int(threshold_bits(amplitude, self.threshold))
+        other = 1 - bit
+        previous = self.levels[bit]
+        self.levels[bit] += self.rate * (amplitude - previous)
+        if previous > 0:
+            self.levels[other] *= self.levels[bit] / previous
+        return bit
+
+
+class SymbolTracker:
+    # Incremental symbol timing and slicing on an amplitude envelope.
+    #
+    # Each symbol is a `tone_length`-sample burst repeated every `period`
+    # samples (TONE_DURATION plus the PTT delays and PAUSE_DURATION of
+    # sendBit(), see markers.SYMBOL_PERIOD). The first burst after `start` is
+    # found by searching half a period either side of `start` for the window
+    # whose following pause is quietest relative to the tone. The ratio is
+    # summed over the first `acquire_symbols` periods, so it is independent
+    # of the bit values and of the gain. From then on an early-late gate
+    # keeps the window on the tone: the energy of the window moved `gate`
+    # samples early is compared with the one moved `gate` samples late. For a flat burst of height h the difference is
+    # -2 * h * offset, so dividing by twice the window's mean level gives
+    # the timing offset in samples. A second-order loop corrects the next
+    # symbol start by `timing_gain` times that offset and the period by
+    # `period_gain` times it. The period correction absorbs a mismatch between
+    # the nominal and the actual sampling rate.
+    #
+    # Each symbol's amplitude is the envelope mean over the middle half of
+    # its window, sliced by AdaptiveThreshold. Windows quieter than `silence`
+    # times the quiet level carry no tone. They are skipped without a bit or
+    # a timing update.
+    #
+    # Work per sample is constant and only about two periods of envelope are
+    # buffered, so the decoder can run on arbitrarily long captures.
+    def __init__(self, period, tone_length, start=0, end=None, gate=None, timing_gain=0.5,
+                 period_gain=0.05, silence=0.25, acquire_symbols=4, threshold=None):
+        self.period = float(period)
+        self.tone_length = int(tone_length)
+        self.gate = int(gate if gate is not None else max(1, (self.period - self.tone_length) // 2))
+        self.timing_gain = timing_gain
+        self.period_gain = period_gain
+        self.silence = silence
+        self.end = end
+        self.acquire_symbols = acquire_symbols
+        if end is not None:
+            self.acquire_symbols = max(1, min(acquire_symbols, int((end - start) // self.period)))
+        self.threshold = threshold if threshold is not None else AdaptiveThreshold()
+
+        self._next = None
+        self._start = int(start)
+        self._buffer = np.zeros(0)
+        self._base = 0
+        self._held = []
+
+        self.bit_positions = []
+        self.timing_offsets = []
+
+    @property
+    def bitstring(self):
+        return "".join(bit for _, _, bit in self.bit_positions)
+
+    @property
+    def finished(self):
+        return self.end is not None and self._next is not None and self._next + self.tone_length > self.end
+
+    def process(self, envelope):
+        # `envelope` continues the stream where the last call stopped; the
+        # first call starts at sample 0. Returns the newly decided
+        # (position, amplitude, bit) triples.
+        if self.finished:
+            self._base += len(envelope)
+            return []
+        self._buffer = np.concatenate((self._buffer, np.asarray(envelope, dtype=np.float64)))
+        cumulative = cumulative_sum(self._buffer)
+        available = self._base + self._buffer.size
+        decided = []
+
+        if self._next is None and self._start + int((self.acquire_symbols + 0.5) * self.period) + 1 <= available:
+            self._next = self._acquire(cumulative, self._start)
+
+        while self._next is not None and self._next + self.tone_length + self.gate <= available:
+            if self.finished:
+                break
+            decided.extend(self._step(cumulative))
+
+        # Keep everything from just before the next window onward.
+        upcoming = self._start - int(self.period) // 2 if self._next is None else int(self._next)
+        keep_from = min(max(0, upcoming - self.gate - 1 - self._base), self._buffer.size)
+        self._buffer = self._buffer[keep_from:]
+        self._base += keep_from
+        return decided
+
+    def flush(self):
+        # The stream has ended: whatever follows is silence, which lets the
+        # late gate of the last symbol (or the acquisition of a short frame)
+        # be evaluated too.
+        decided = self.process(np.zeros(int(self.period) + self.gate))
+        return decided + self._decide(self.threshold.flush())
+
+    def _energy(self, cumulative, first):
+        # Sum of the envelope over [first, first + tone_length) for an array of
+        # absolute start indices.
+        return window_sums(cumulative, np.asarray(first, dtype=np.intp) - self._base, self.tone_length)
+
+    def _acquire(self, cumulative, start):
+        half = int(self.period) // 2
+        candidates = np.arange(max(start - half, self._base), start + half)
+        pause = int(self.period) - self.tone_length
+        if pause <= 0:
+            return float(candidates[0])
+        ratio = 0.0
+        for k in range(self.acquire_symbols):
+            first = candidates + int(round(k * self.period)) - self._base
+            tone = window_sums(cumulative, first, self.tone_length)
+            quiet = window_sums(cumulative, first + self.tone_length, pause)
+            ratio = ratio + (quiet / pause) / np.maximum(tone / self.tone_length, 1e-12)
+        # Windows longer than the tones give a run of equally good phases;
+        # take the middle one.
+        best = np.flatnonzero(ratio <= ratio.min() + 1e-9)
+        return float(candidates[(best[0] + best[-1]) // 2])
+
+    def _step(self, cumulative):
+        first = int(round(self._next))
+        early, centre, late = self._energy(cumulative, [first - self.gate, first, first + self.gate])
+        level = centre / self.tone_length
+
+        quarter = self.tone_length // 4
+        middle = first + quarter - self._base
+        amplitude = window_sums(cumulative, middle, 2 * quarter) / (2 * quarter)
+
+        reference = self.threshold.levels[1] if self.threshold.levels else max(
+            [amplitude] + [a for _, a in self._held])
+        if amplitude < self.silence * reference:
+            self._next += self.period
+            return []
+
+        offset = 0.0
+        if level > 0:
+            offset = float(np.clip((early - late) / (2 * level), -self.gate, self.gate))
+        self.timing_offsets.append(offset)
+        self._next += self.period - self.timing_gain * offset
+        self.period -= self.period_gain * offset
+
+        self._held.append((first, float(amplitude)))
+        return self._decide(self.threshold.update(amplitude))
+
+    def _decide(self, bits):
+        decided = [(position, amplitude, str(bit)) for (position, amplitude), bit in zip(self._held, bits)]
+        self._held = self._held[len(bits):]
+        self.bit_positions.extend(decided)
+        return decided
+
+
+def track_symbols(envelope, start, end, period, tone_length, **kwargs):
+    # Offline use of SymbolTracker on one frame of an envelope that is
+    # indexed like the capture. Returns the tracker once it is flushed.
+    tracker = SymbolTracker(period, tone_length, start=start, end=end, **kwargs)
+    tracker.process(envelope[:end])
+    tracker.flush()
+    return tracker
@@ -0,0 +1,124 @@
+import argparse
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Postprocessing"))
+from fskdecoder.fec import INTERLEAVE_DEPTH, fec_encode
+from fskdecoder.markers import SYMBOL_PERIOD
+from fskdecoder.payload import COMPRESSION, MAX_DEPTH, decode_payload, encode_image, quantize_image
+from fskdecoder.slicing import bits_to_string, string_to_bits
+from fskdecoder.tiles import TileReconstructor, encode_tiles
+
+def read_netpbm(file_path):
+    # PBM/PGM (P1, P2, P4, P5) as 8-bit grey levels, without Pillow.
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    fields = []
+    position = 0
+    while len(fields) < (3 if data[:2] in (b'P1', b'P4') else 4):
+        while data[position:position + 1].isspace():
+            position += 1
+        if data[position:position + 1] == b'#':
+            position = data.index(b'\n', position)
+            continue
+        end = position
+        while end < len(data) and not data[end:end + 1].isspace():
+            end += 1
+        fields.append(data[position:end])
+        position = end
+    magic = fields[0]
+    width, height = int(fields[1]), int(fields[2])
+    maximum = int(fields[3]) if len(fields) > 3 else 1
+    body = data[position + 1:]
+
+    if magic == b'P4':
+        row_bytes = (width + 7) // 8
+        bits = np.unpackbits(np.frombuffer(body, np.uint8)[:row_bytes * height].reshape(height, row_bytes), axis=1)
+        return ((1 - bits[:, :width]) * 255).astype(np.uint8)
+    if magic == b'P5':
+        dtype = np.dtype('>u2') if maximum > 255 else np.uint8
+        pixels = np.frombuffer(body, dtype)[:width * height].reshape(height, width)
+    elif magic == b'P1':
+        # Digits may or may not be separated; 1 is black.
+        bits = string_to_bits(bytes(c for c in body if c in b'01').decode('ascii'))
+        return ((1 - bits[:width * height].reshape(height, width)) * 255).astype(np.uint8)
+    elif magic == b'P2':
+        pixels = np.array(body.split(), dtype=np.int64)[:width * height].reshape(height, width)
+    else:
+        raise ValueError(f"{file_path}: not a PBM/PGM file")
+    return np.round(pixels.astype(np.float64) * 255 / maximum).astype(np.uint8)
+
+def read_image(file_path):
+    # 8-bit grey levels of a PBM/PGM file, or of any format Pillow reads
+    # (PNG, BMP, ...).
+    if os.path.splitext(file_path)[1].lower() in ('.pbm', '.pgm', '.pnm'):
+        return read_netpbm(file_path)
+    try:
+        from PIL import Image
+    except ImportError:
+        raise SystemExit("Reading PNG/BMP images needs Pillow (pip install pillow); PBM/PGM work without it.")
+    with Image.open(file_path) as image:
+        return np.asarray(image.convert('L'))
+
+def resize(pixels, width, height):
+    # Nearest-neighbour, so 1-bpp artwork stays crisp.
+    rows = (np.arange(height) * pixels.shape[0]) // height
+    columns = (np.arange(width) * pixels.shape[1]) // width
+    return pixels[rows[:, None], columns]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Turn an image into the bit file testAudioSender.ino transmits.")
+    parser.add_argument("image", help="PBM/PGM image, or PNG/BMP/... with Pillow installed")
+    parser.add_argument("--output", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "binary.txt"))
+    parser.add_argument("--depth", type=int, default=1, choices=range(1, MAX_DEPTH + 1),
+                        help="bits per pixel")
+    parser.add_argument("--compression", default="auto", choices=["auto", *COMPRESSION],
+                        help="auto sends whichever of none and (run-length coded bit) planes is shorter")
+    parser.add_argument("--size", metavar="WxH", help="scale the image to W x H pixels first")
+    parser.add_argument("--invert", action="store_true", help="swap black and white")
+    parser.add_argument("--tile", type=int, default=0,
+                        help="send tile x tile blocks with their own CRC, so partial receptions show (0 = off)")
+    parser.add_argument("--tile-compressed", action="store_true",
+                        help="run-length code tiles: shorter, but a wrong length bit loses every later tile")
+    parser.add_argument("--fec", action="store_true",
+                        help="add Hamming(7,4) error correction (7 bits sent per 4, single errors repaired)")
+    parser.add_argument("--interleave", type=int, default=INTERLEAVE_DEPTH,
+                        help="codewords per interleaver block with --fec")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    pixels = read_image(args.image)
+    if args.size:
+        width, height = (int(value) for value in args.size.lower().split('x'))
+        pixels = resize(pixels, width, height)
+    if args.invert:
+        pixels = 255 - pixels
+
+    levels = quantize_image(pixels, args.depth)
+    if args.tile:
+        bits = encode_tiles(levels, args.depth, args.tile, compressed=args.tile_compressed)
+        reconstructor = TileReconstructor()
+        reconstructor.feed(bits)
+        decoded = reconstructor.image
+    else:
+        bits = encode_image(levels, args.depth, args.compression)
+        decoded, _ = decode_payload(bits)
+    if not np.array_equal(decoded, levels):
+        raise RuntimeError("the encoded payload does not decode to the image; not writing it")
+    sent = fec_encode(bits, args.interleave) if args.fec else bits
+
+    with open(args.output, 'w') as f:
+        f.write(bits_to_string(sent))
+
+    height, width = levels.shape
+    raw = width * height * args.depth
+    coding = f" ({sent.size} with error correction)" if args.fec else ""
+    print(f"{width}x{height} pixels, {args.depth} bpp: {bits.size} bits{coding} "
+          f"({raw} bits of pixels), about {sent.size * SYMBOL_PERIOD / 60:.1f} min of airtime")
+    print(f"Wrote {args.output}")
+
+if __name__ == '__main__':
+    main()
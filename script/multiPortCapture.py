@@ -0,0 +1,229 @@
+import argparse
+import asyncio
+import os
+import re
+import sys
+import time
+
+import serial
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "Postprocessing"))
+from fskdecoder.capturefile import LineSplitter
+from scanSerialPort import CaptureSink, ReaderStats, SampleRing
+from fskdecoder.tones import EFFECTIVE_SAMPLING_RATE
+
+# Reads any number of T-TWR receivers on one asyncio event loop. Every port is
+# registered with loop.add_reader() on its file descriptor, so a read only
+# happens when the port has data and never blocks the other ports (POSIX
+# only: the Windows proactor loop has no add_reader()). Each port has its own
+# sample ring, output file(s) and counters; disk writes run in a worker
+# thread so a slow disk cannot stall the reads.
+
+class PortCapture:
+    def __init__(self, port, sink, baud_rate=115200, ring_samples=1 << 20, batch_samples=1 << 16):
+        self.port = port
+        self.sink = sink
+        self.baud_rate = baud_rate
+        self.batch_samples = batch_samples
+        self.ring = SampleRing(ring_samples)
+        self.stats = ReaderStats()
+        self.ser = None
+        self._lines = LineSplitter()
+        self._data = asyncio.Event()
+        self._reported = 0
+
+    def open(self, loop):
+        self.ser = serial.Serial(self.port, self.baud_rate, timeout=0)
+        loop.add_reader(self.ser.fileno(), self._on_readable)
+
+    def close(self, loop):
+        if self.ser is not None:
+            loop.remove_reader(self.ser.fileno())
+            self.ser.close()
+
+    def _on_readable(self):
+        try:
+            data = self.ser.read(max(self.ser.in_waiting, 1))
+        except serial.SerialException as e:
+            print(f"{self.port}: error reading from serial port: {e}")
+            asyncio.get_running_loop().remove_reader(self.ser.fileno())
+            return
+        if not data:
+            return
+        self.stats.reads += 1
+        self.stats.bytes += len(data)
+
+        samples, bad = self._lines.feed(data)
+        self.stats.bad_lines += bad
+        if samples.size:
+            self.ring.put(samples)
+            self._data.set()
+
+    async def drain(self, stop):
+        # Writer task: hands batches to the sink in a worker thread until the
+        # capture is stopped and the ring is empty.
+        try:
+            while not (stop.is_set() and not len(self.ring)):
+                try:
+                    await asyncio.wait_for(self._data.wait(), self.sink.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._data.clear()
+                batch = self.ring.get(self.batch_samples, timeout=0)
+                if batch.size:
+                    await asyncio.to_thread(self.sink.write, batch)
+                else:
+                    await asyncio.to_thread(self.sink.tick)
+                if len(self.ring):
+                    self._data.set()
+        finally:
+            await asyncio.to_thread(self.sink.close)
+
+    def report(self, seconds):
+        rate = (self.ring.received - self._reported) / seconds
+        self._reported = self.ring.received
+        print(f"{self.port}: {rate:7.0f} samples/s | {self.ring.received} received | "
+              f"dropped {self.ring.dropped} in {self.ring.overruns} overruns | "
+              f"unreadable lines {self.stats.bad_lines}")
+
+def port_output(pattern, port):
+    # "{port}" in the output pattern becomes a file-name-safe form of the port.
+    name = re.sub(r'[^A-Za-z0-9_.-]+', '_', os.path.basename(port)) or "port"
+    if "{port}" in pattern:
+        return pattern.replace("{port}", name)
+    stem, ext = os.path.splitext(pattern)
+    return f"{stem}_{name}{ext}"
+
+def open_pty_pair():
+    # A pseudo-terminal stands in for a receiver: samples written to the
+    # returned master fd arrive on the returned port path.
+    import pty
+    import tty
+
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    os.set_blocking(master, False)
+    return master, slave, os.ttyname(slave)
+
+async def feed_pty(master, samples, sampling_rate, stop, block_seconds=0.05):
+    # Writes `samples` as the receiver firmware prints them, paced at
+    # sampling_rate.
+    step = max(1, int(sampling_rate * block_seconds))
+    started = time.monotonic()
+    for index in range(0, len(samples), step):
+        if stop.is_set():
+            return
+        data = ("\n".join(map(str, samples[index:index + step].tolist())) + "\n").encode()
+        while data:
+            try:
+                data = data[os.write(master, data):]
+            except BlockingIOError:
+                await asyncio.sleep(0.005)
+        delay = started + (index + step) / sampling_rate - time.monotonic()
+        await asyncio.sleep(max(delay, 0))
+
+def simulated_samples(count, seed):
+    import numpy as np
+    from fskdecoder.simulate import ChannelSimulator, random_frames
+
+    simulator = ChannelSimulator(random_frames(16, 8, seed), count, seed=seed)
+    return np.concatenate(list(simulator.chunks()))
+
+async def run(args):
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    ports = list(args.ports)
+    feeders = []
+    if args.simulate:
+        rate = args.simulate_rate
+        for index in range(args.simulate):
+            master, slave, name = open_pty_pair()
+            samples = simulated_samples(int(rate * args.duration), index)
+            feeders.append((master, slave, samples))
+            ports.append(name)
+
+    captures = []
+    for port in ports:
+        sink = CaptureSink(port_output(args.output, port), binary=args.binary, port=port,
+                           flush_interval=args.flush_interval, flush_bytes=args.flush_kb * 1024,
+                           rotate_bytes=int(args.rotate_mb * 1e6) if args.rotate_mb else None,
+                           rotate_seconds=args.rotate_minutes * 60 if args.rotate_minutes else None)
+        capture = PortCapture(port, sink, args.baud, args.ring_samples)
+        try:
+            capture.open(loop)
+        except Exception as e:
+            print(f"Error opening serial port {port}: {e}")
+            continue
+        print(f"Connected to {port} at {args.baud} baud.")
+        captures.append(capture)
+    if not captures:
+        return
+
+    writers = [asyncio.create_task(capture.drain(stop)) for capture in captures]
+    feeding = [asyncio.create_task(feed_pty(master, samples, args.simulate_rate, stop))
+               for master, _, samples in feeders]
+    started = last = time.monotonic()
+    try:
+        while not args.duration or time.monotonic() - started < args.duration:
+            await asyncio.sleep(min(args.stats_interval or 1, args.duration or float('inf')))
+            if args.stats_interval:
+                now = time.monotonic()
+                for capture in captures:
+                    capture.report(now - last)
+                last = now
+        # Give in-flight bytes of simulated ports time to arrive.
+        if feeding:
+            await asyncio.wait(feeding)
+            await asyncio.sleep(0.5)
+    finally:
+        stop.set()
+        for capture in captures:
+            capture.close(loop)
+        await asyncio.gather(*writers)
+        for master, slave, _ in feeders:
+            os.close(master)
+            os.close(slave)
+        for capture in captures:
+            print(f"{capture.port}: captured {capture.ring.received - capture.ring.dropped} samples, "
+                  f"dropped {capture.ring.dropped}, unreadable lines {capture.stats.bad_lines} "
+                  f"-> {', '.join(capture.sink.files)}")
+        if feeders:
+            print(f"Each simulated port sent {len(feeders[0][2])} samples.")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Record ADC samples from several T-TWR receivers at once.")
+    parser.add_argument("ports", nargs="*", help="Serial ports, e.g. /dev/cu.usbmodem101 /dev/cu.usbmodem201")
+    parser.add_argument("--baud", type=int, default=115200)
+    parser.add_argument("--output", default="serial_data_{port}.txt",
+                        help="Output file pattern; {port} is replaced by the port name")
+    parser.add_argument("--binary", action="store_true",
+                        help="Write binary uint16 captures instead of one decimal line per sample")
+    parser.add_argument("--ring-samples", type=int, default=1 << 20)
+    parser.add_argument("--flush-interval", type=float, default=1.0)
+    parser.add_argument("--flush-kb", type=int, default=1024)
+    parser.add_argument("--rotate-mb", type=float, default=None)
+    parser.add_argument("--rotate-minutes", type=float, default=None)
+    parser.add_argument("--stats-interval", type=float, default=5.0,
+                        help="Seconds between per-port throughput reports (0 to disable)")
+    parser.add_argument("--duration", type=float, default=0, help="Stop after this many seconds (0 = run until Ctrl-C)")
+    parser.add_argument("--simulate", type=int, default=0, metavar="N",
+                        help="Add N pseudo-terminal ports fed with simulated receiver output")
+    parser.add_argument("--simulate-rate", type=float, default=EFFECTIVE_SAMPLING_RATE,
+                        help="Samples per second sent on each simulated port")
+    args = parser.parse_args()
+    if args.simulate and not args.duration:
+        args.duration = 10.0
+    return args
+
+def main():
+    args = parse_args()
+    if not args.ports and not args.simulate:
+        print("No serial ports given.")
+        return
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        print("Exiting program.")
+
+if __name__ == '__main__':
+    main()
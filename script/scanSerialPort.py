@@ -1,34 +1,225 @@
+import argparse
+import os
+import sys
 import serial
 import time
 import threading
-import queue
-
-def serial_reader(ser, data_queue):
-    while True:
-        if ser.in_waiting > 0:
-            try:
-                line = ser.readline().decode('utf-8', errors='replace').strip()
-                if line:
-                    data_queue.put(line)
-            except Exception as e:
-                print(f"Error reading line: {e}")
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "Postprocessing"))
+from fskdecoder.capturefile import CaptureWriter, DEFAULT_SAMPLE_PERIOD, LineSplitter
+
+class SampleRing:
+    # Preallocated uint16 ring between the serial reader and the writer. If
+    # the writer falls behind until the ring is full, incoming samples are
+    # dropped and counted (an overrun) instead of memory growing without
+    # bound; the serial port itself is never left unread.
+    def __init__(self, capacity=1 << 20):
+        self.capacity = capacity
+        self._buffer = np.empty(capacity, dtype=np.uint16)
+        self._start = 0
+        self._size = 0
+        self._ready = threading.Condition()
+        self.received = 0
+        self.dropped = 0
+        self.overruns = 0
+        self.high_water = 0
+
+    def __len__(self):
+        return self._size
+
+    def put(self, samples):
+        with self._ready:
+            take = min(self.capacity - self._size, samples.size)
+            if take < samples.size:
+                self.dropped += samples.size - take
+                self.overruns += 1
+            end = (self._start + self._size) % self.capacity
+            first = min(take, self.capacity - end)
+            self._buffer[end:end + first] = samples[:first]
+            self._buffer[:take - first] = samples[first:take]
+            self._size += take
+            self.received += samples.size
+            self.high_water = max(self.high_water, self._size)
+            self._ready.notify()
+        return samples.size - take
+
+    def get(self, max_samples=1 << 16, timeout=1.0):
+        # Oldest samples first; an empty array if nothing arrived in time.
+        with self._ready:
+            if not self._size:
+                self._ready.wait(timeout)
+            take = min(self._size, max_samples)
+            first = min(take, self.capacity - self._start)
+            batch = np.concatenate((self._buffer[self._start:self._start + first], self._buffer[:take - first]))
+            self._start = (self._start + take) % self.capacity
+            self._size -= take
+        return batch
+
+class ReaderStats:
+    def __init__(self):
+        self.bytes = 0
+        self.reads = 0
+        self.bad_lines = 0
+        self.backlog = 0
+        self.max_backlog = 0
+
+def serial_reader(ser, ring, stats, stop, read_size=1 << 14):
+    # Bulk reads: ser.read() returns once read_size bytes are in or the port
+    # timeout expires, so there is no polling and no per-line decoding. Whole
+    # lines are parsed in one batch; a partial line waits for the next read.
+    lines = LineSplitter()
+    while not stop.is_set():
+        try:
+            stats.backlog = ser.in_waiting
+            data = ser.read(max(read_size, stats.backlog))
+        except serial.SerialException as e:
+            print(f"Error reading from serial port: {e}")
+            stop.set()
+            break
+        if not data:
+            continue
+        stats.reads += 1
+        stats.bytes += len(data)
+        stats.max_backlog = max(stats.max_backlog, stats.backlog)
+
+        samples, bad = lines.feed(data)
+        stats.bad_lines += bad
+        if samples.size:
+            ring.put(samples)
+
+class CaptureSink:
+    # Output side of the capture: batches of samples go out as decimal lines
+    # (text) or as a binary capture. Data is flushed once flush_interval
+    # seconds or flush_bytes bytes have accumulated instead of after every
+    # sample. With rotate_bytes or rotate_seconds set, a new file named
+    # <output>_<start time><ext> is started whenever the current one reaches
+    # either limit.
+    def __init__(self, filename, binary=False, port="", flush_interval=1.0, flush_bytes=1 << 20,
+                 rotate_bytes=None, rotate_seconds=None, sample_period=DEFAULT_SAMPLE_PERIOD):
+        self.filename = filename
+        self.binary = binary
+        self.port = port
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.sample_period = sample_period
+        self.files = []
+        self._file = None
+
+    @property
+    def rotating(self):
+        return bool(self.rotate_bytes or self.rotate_seconds)
+
+    def _next_name(self):
+        if not self.rotating:
+            return self.filename
+        stem, ext = os.path.splitext(self.filename)
+        name = f"{stem}_{time.strftime('%Y%m%d-%H%M%S')}{ext}"
+        counter = 1
+        while os.path.exists(name) or name in self.files:
+            name = f"{stem}_{time.strftime('%Y%m%d-%H%M%S')}_{counter}{ext}"
+            counter += 1
+        return name
+
+    def _open(self):
+        name = self._next_name()
+        if self.binary:
+            self._file = CaptureWriter(name, sample_period=self.sample_period, port=self.port)
+        else:
+            self._file = open(name, 'a', buffering=1 << 20)
+        self.files.append(name)
+        self._opened = time.monotonic()
+        self._flushed = self._opened
+        self._size = 0
+        self._unflushed = 0
+        print(f"Writing to {name}")
+
+    def write(self, batch):
+        if self._file is None:
+            self._open()
+        if self.binary:
+            self._file.write(batch)
+            size = batch.size * 2
         else:
-            time.sleep(0.1)
-
-def file_writer(data_queue, filename):
-    with open(filename, 'a') as file:
-        while True:
-            try:
-                line = data_queue.get(timeout=1)
-                file.write(line + '\n')
-                file.flush()
-            except queue.Empty:
-                continue
+            text = "\n".join(map(str, batch.tolist())) + "\n"
+            self._file.write(text)
+            size = len(text)
+        self._size += size
+        self._unflushed += size
+        self.tick()
+
+    def tick(self):
+        # Called after every write and whenever the ring had nothing to give.
+        if self._file is None:
+            return
+        now = time.monotonic()
+        if self._unflushed >= self.flush_bytes or (self._unflushed and now - self._flushed >= self.flush_interval):
+            self.flush()
+        if (self.rotate_bytes and self._size >= self.rotate_bytes) or \
+                (self.rotate_seconds and now - self._opened >= self.rotate_seconds):
+            self.close()
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+            self._flushed = time.monotonic()
+            self._unflushed = 0
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+def sample_writer(ring, sink, stop, batch_samples=1 << 16):
+    # Drains the ring a batch at a time until it is stopped and empty.
+    try:
+        while not (stop.is_set() and not len(ring)):
+            batch = ring.get(batch_samples, timeout=sink.flush_interval)
+            if batch.size:
+                sink.write(batch)
+            else:
+                sink.tick()
+    finally:
+        sink.close()
+
+def report(ring, stats, previous, seconds):
+    rate = (ring.received - previous) / seconds
+    print(f"{rate:7.0f} samples/s | ring {100 * len(ring) / ring.capacity:5.1f}% "
+          f"(peak {100 * ring.high_water / ring.capacity:.1f}%) | dropped {ring.dropped} in {ring.overruns} overruns "
+          f"| unreadable lines {stats.bad_lines} | port backlog {stats.backlog} B (max {stats.max_backlog} B)")
+    return ring.received
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Record ADC samples from the T-TWR receiver.")
+    parser.add_argument("--port", default='/dev/cu.usbmodem101')
+    parser.add_argument("--baud", type=int, default=115200)
+    parser.add_argument("--output", default=None,
+                        help="Output file (default: serial_data.txt, or serial_data.bin with --binary)")
+    parser.add_argument("--binary", action="store_true",
+                        help="Write a binary uint16 capture instead of one decimal line per sample")
+    parser.add_argument("--ring-samples", type=int, default=1 << 20,
+                        help="Samples buffered between reader and writer before new ones are dropped")
+    parser.add_argument("--read-size", type=int, default=1 << 14, help="Bytes requested per serial read")
+    parser.add_argument("--flush-interval", type=float, default=1.0,
+                        help="Seconds of data that may sit in memory before it is flushed to disk")
+    parser.add_argument("--flush-kb", type=int, default=1024,
+                        help="Unflushed kilobytes that trigger a flush")
+    parser.add_argument("--rotate-mb", type=float, default=None,
+                        help="Start a new timestamped output file after this many megabytes")
+    parser.add_argument("--rotate-minutes", type=float, default=None,
+                        help="Start a new timestamped output file after this many minutes")
+    parser.add_argument("--stats-interval", type=float, default=5.0,
+                        help="Seconds between throughput reports (0 to disable)")
+    return parser.parse_args()
 
 def main():
-    port = '/dev/cu.usbmodem101'
-    baud_rate = 115200
-    output_file = "serial_data.txt"
+    args = parse_args()
+    port = args.port
+    baud_rate = args.baud
+    output_file = args.output or ("serial_data.bin" if args.binary else "serial_data.txt")
 
     try:
         ser = serial.Serial(port, baud_rate, timeout=0.1)
@@ -37,21 +228,39 @@ def main():
         print(f"Error opening serial port: {e}")
         return
 
-    data_queue = queue.Queue()
+    ring = SampleRing(args.ring_samples)
+    stats = ReaderStats()
+    stop = threading.Event()
 
-    reader_thread = threading.Thread(target=serial_reader, args=(ser, data_queue), daemon=True)
+    reader_thread = threading.Thread(target=serial_reader, args=(ser, ring, stats, stop, args.read_size))
     reader_thread.start()
 
-    writer_thread = threading.Thread(target=file_writer, args=(data_queue, output_file), daemon=True)
+    sink = CaptureSink(output_file, binary=args.binary, port=port, flush_interval=args.flush_interval,
+                       flush_bytes=args.flush_kb * 1024,
+                       rotate_bytes=int(args.rotate_mb * 1e6) if args.rotate_mb else None,
+                       rotate_seconds=args.rotate_minutes * 60 if args.rotate_minutes else None)
+    writer_thread = threading.Thread(target=sample_writer, args=(ring, sink, stop))
     writer_thread.start()
 
     try:
-        while True:
-            time.sleep(1)
+        received = 0
+        last = time.monotonic()
+        while not stop.is_set():
+            time.sleep(args.stats_interval or 1)
+            if args.stats_interval:
+                now = time.monotonic()
+                received = report(ring, stats, received, now - last)
+                last = now
     except KeyboardInterrupt:
         print("Exiting program.")
     finally:
+        stop.set()
+        reader_thread.join()
+        # The writer empties the ring before it closes the file.
+        writer_thread.join()
         ser.close()
+        print(f"Captured {ring.received - ring.dropped} samples, dropped {ring.dropped}, "
+              f"unreadable lines {stats.bad_lines}.")
 
 if __name__ == '__main__':
     main()